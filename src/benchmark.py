@@ -0,0 +1,241 @@
+#region ------- IMPORTS -------------------------------------------------------------------------------------
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from urllib.parse import urlsplit
+import httpx
+
+#endregion ---- IMPORTS -------------------------------------------------------------------------------------
+
+#region ------- CONSTANTS -----------------------------------------------------------------------------------
+
+# Request templates cycled through by the load generator, {user_id} walks over the 10 users
+DEFAULT_ENDPOINTS = ["/users?limit=5", "/todos?userId={user_id}&limit=5"]
+
+# Application settings of each variant, on top of the environment of the benchmark itself
+VARIANTS = {
+    "logging": {"REQUEST_LOGGING": "true"},
+    "no_logging": {"REQUEST_LOGGING": "false"}
+}
+
+READY_TIMEOUT = 30
+
+#endregion ---- CONSTANTS -----------------------------------------------------------------------------------
+
+#region ------- UTILS ---------------------------------------------------------------------------------------
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def percentile(ordered: list, fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not ordered:
+        return None
+    rank = max(1, round(fraction * len(ordered) + 0.5 - 1e-9))
+    return ordered[min(rank, len(ordered)) - 1]
+
+def summarize(latencies: list, errors: int, elapsed: float) -> dict:
+    """Throughput and latency percentiles (milliseconds) of one endpoint over a run lasting [elapsed] seconds"""
+    ordered = sorted(latencies)
+    total = len(ordered) + errors
+    return {
+        "requests": total,
+        "errors": errors,
+        "error_rate": errors / total if total else 0.0,
+        "throughput_rps": total / elapsed if elapsed > 0 else 0.0,
+        "mean_ms": sum(ordered) / len(ordered) if ordered else None,
+        "p50_ms": percentile(ordered, 0.50),
+        "p95_ms": percentile(ordered, 0.95),
+        "p99_ms": percentile(ordered, 0.99)
+    }
+
+def wait_ready(url: str, process: subprocess.Popen, timeout: float = READY_TIMEOUT):
+    """Polls [url] until it answers, failing early if [process] exits"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Process serving {url} exited with code {process.returncode}")
+        try:
+            if httpx.get(url, timeout=1).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.1)
+    raise RuntimeError(f"{url} was not ready after {timeout} seconds")
+
+@contextmanager
+def serve(args: list, ready_url: str, env: dict = None):
+    """Runs `python -m [args]` until the block exits, once [ready_url] answers"""
+    process = subprocess.Popen([sys.executable, "-m", *args], env=env)
+    try:
+        wait_ready(ready_url, process)
+        yield process
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+#endregion ---- UTILS ---------------------------------------------------------------------------------------
+
+#region ------- LOAD ----------------------------------------------------------------------------------------
+
+async def drive(base_url: str, endpoints: list, concurrency: int, requests: int, duration: float = None,
+                warmup: int = 0, transport: httpx.AsyncBaseTransport = None) -> dict:
+    """Sends [requests] requests (or as many as fit in [duration] seconds) with [concurrency] in flight
+
+    Endpoints are cycled through in order and reported separately, keyed on their path, along with
+    an "all" entry. Failed requests (transport errors or status >= 500) count as errors and are left
+    out of the latency percentiles.
+    """
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30, transport=transport) as client:
+        def url(index: int) -> str:
+            template = endpoints[index % len(endpoints)]
+            return template.format(user_id=(index // len(endpoints)) % 10 + 1)
+
+        for index in range(warmup):
+            try:
+                await client.get(url(index))
+            except httpx.HTTPError:
+                pass
+
+        paths = [urlsplit(template).path for template in endpoints]
+        latencies = {path: [] for path in paths}
+        errors = {path: 0 for path in paths}
+        counter = itertools.count()
+        started = time.perf_counter()
+        deadline = started + duration if duration else None
+
+        async def worker():
+            while True:
+                index = next(counter)
+                if index >= requests or (deadline and time.perf_counter() >= deadline):
+                    return
+                path = paths[index % len(paths)]
+                sent = time.perf_counter()
+                try:
+                    failed = (await client.get(url(index))).status_code >= 500
+                except httpx.HTTPError:
+                    failed = True
+                if failed:
+                    errors[path] += 1
+                else:
+                    latencies[path].append((time.perf_counter() - sent) * 1000)
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    report = {path: summarize(latencies[path], errors[path], elapsed) for path in paths}
+    report["all"] = summarize([value for path in paths for value in latencies[path]], sum(errors.values()), elapsed)
+    return report
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Lists the endpoints whose p95 latency grew, or throughput dropped, by more than [tolerance] over [baseline]"""
+    regressions = []
+    for variant, endpoints in baseline.get("variants", {}).items():
+        for endpoint, expected in endpoints.items():
+            current = results.get("variants", {}).get(variant, {}).get(endpoint)
+            if current is None:
+                continue
+            if expected.get("p95_ms") and current["p95_ms"] and current["p95_ms"] > expected["p95_ms"] * (1 + tolerance):
+                regressions.append(f"{variant} {endpoint}: p95 {current['p95_ms']:.1f}ms over baseline {expected['p95_ms']:.1f}ms")
+            if current["throughput_rps"] < expected["throughput_rps"] * (1 - tolerance):
+                regressions.append(
+                    f"{variant} {endpoint}: {current['throughput_rps']:.0f} req/s under baseline {expected['throughput_rps']:.0f} req/s"
+                )
+    return regressions
+
+#endregion ---- LOAD ----------------------------------------------------------------------------------------
+
+#region ------- RUN -----------------------------------------------------------------------------------------
+
+def run_variant(name: str, args, upstream_url: str) -> dict:
+    """Starts the application against the stub with the settings of variant [name] and drives load on it"""
+    with tempfile.TemporaryDirectory() as directory:
+        port = free_port()
+        env = {
+            **os.environ,
+            "UPSTREAM_BASE_URL": upstream_url,
+            "DATABASE_URL": args.database_url or f"sqlite:///{os.path.join(directory, 'bench.db')}",
+            **dict(setting.split("=", 1) for setting in args.set),
+            **VARIANTS[name]
+        }
+        app_args = ["uvicorn", "src.main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning", "--no-access-log"]
+        base_url = f"http://127.0.0.1:{port}"
+        subprocess.run([sys.executable, "-m", "src.migrations", "upgrade"], env=env, check=True)
+        with serve(app_args, f"{base_url}/cache_stats", env=env):
+            return asyncio.run(drive(base_url, args.endpoints, args.concurrency, args.requests, args.duration, args.warmup))
+
+def print_report(results: dict):
+    print(f"{'variant':<12} {'endpoint':<10} {'requests':>9} {'errors':>7} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for variant, endpoints in results["variants"].items():
+        for endpoint, stats in endpoints.items():
+            cells = [stats[key] if stats[key] is not None else float("nan") for key in ("throughput_rps", "p50_ms", "p95_ms", "p99_ms")]
+            print(f"{variant:<12} {endpoint:<10} {stats['requests']:>9} {stats['errors']:>7} "
+                  f"{cells[0]:>9.0f} {cells[1]:>8.2f} {cells[2]:>8.2f} {cells[3]:>8.2f}")
+
+#endregion ---- RUN -----------------------------------------------------------------------------------------
+
+#region ------- CLI -----------------------------------------------------------------------------------------
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description="Offline load test of the API against a local stub of jsonplaceholder")
+    parser.add_argument("--concurrency", type=int, default=50, help="Requests in flight")
+    parser.add_argument("--requests", type=int, default=5000, help="Requests sent per variant")
+    parser.add_argument("--duration", type=float, default=None, help="Stop a variant after this many seconds")
+    parser.add_argument("--warmup", type=int, default=100, help="Requests sent before measuring")
+    parser.add_argument("--endpoints", nargs="+", default=DEFAULT_ENDPOINTS, help="Request templates, {user_id} cycles over users")
+    parser.add_argument("--variants", nargs="+", default=list(VARIANTS), choices=list(VARIANTS))
+    parser.add_argument("--latency-ms", type=float, default=20, help="Latency of the upstream stub")
+    parser.add_argument("--jitter-ms", type=float, default=5, help="Random extra latency of the upstream stub")
+    parser.add_argument("--error-rate", type=float, default=0, help="Fraction of upstream requests failing with a 500")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--database-url", default=None, help="Database of the request logs (default is a fresh SQLite file)")
+    parser.add_argument("--set", nargs="*", default=[], metavar="KEY=VALUE", help="Extra application settings")
+    parser.add_argument("--output", default=None, help="Write the results to this JSON file")
+    parser.add_argument("--baseline", default=None, help="Fail when results regress over this JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Allowed relative regression over the baseline")
+    args = parser.parse_args(argv)
+
+    stub_port = free_port()
+    stub_url = f"http://127.0.0.1:{stub_port}"
+    stub_args = ["src.upstream_stub", "--port", str(stub_port), "--latency-ms", str(args.latency_ms),
+                 "--jitter-ms", str(args.jitter_ms), "--error-rate", str(args.error_rate), "--seed", str(args.seed)]
+
+    results = {"started_at": datetime.now(timezone.utc).isoformat(), "settings": vars(args), "variants": {}}
+    with serve(stub_args, f"{stub_url}/users"):
+        for name in args.variants:
+            results["variants"][name] = run_variant(name, args, stub_url)
+
+    print_report(results)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
+
+#endregion ---- CLI -----------------------------------------------------------------------------------------
@@ -0,0 +1,160 @@
+#region ------- IMPORTS -------------------------------------------------------------------------------------
+
+import asyncio
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Hashable
+
+#endregion ---- IMPORTS -------------------------------------------------------------------------------------
+
+#region ------- MODEL ---------------------------------------------------------------------------------------
+
+@dataclass
+class CacheEntry:
+    value: Any
+    fetched_at: float
+    expires_at: float
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    stale_hits: int = 0
+    misses: int = 0
+    coalesced: int = 0
+    evictions: int = 0
+    refreshes: int = 0
+    refresh_errors: int = 0
+
+#endregion ---- MODEL ---------------------------------------------------------------------------------------
+
+#region ------- CACHE ---------------------------------------------------------------------------------------
+
+class TTLCache:
+    """In-process TTL cache with LRU eviction, stale-while-revalidate and single-flight fetches
+
+    Parameters
+    ----------
+    ttl : float
+
+        Seconds an entry is served as fresh
+
+    stale_ttl : float
+
+        Extra seconds an expired entry is still served while it is refreshed in background (0 disables it)
+
+    max_entries : int
+
+        Maximum number of keys kept, the least recently used one is evicted first
+    """
+
+    def __init__(self, ttl: float, stale_ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self.stats = CacheStats()
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._background = set()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def peek(self, key: Hashable):
+        """Returns the cached value for [key] regardless of its age, or None (does not touch LRU order nor stats)"""
+        entry = self._entries.get(key)
+        return entry.value if entry is not None else None
+
+    def set(self, key: Hashable, value: Any):
+        """Stores [value] as a fresh entry, evicting least recently used keys over [max_entries]"""
+        now = time.monotonic()
+        self._entries[key] = CacheEntry(value=value, fetched_at=now, expires_at=now + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats.evictions += 1
+
+    def clear(self):
+        self._entries.clear()
+
+    async def get_or_fetch(self, key: Hashable, fetch: Callable[[], Awaitable[Any]]):
+        """Returns the value for [key], calling [fetch] at most once per key at any time
+
+        Fresh entries are returned directly, stale ones are returned while a background refresh runs,
+        and on a miss every concurrent caller awaits the same upstream fetch. Exceptions raised by
+        [fetch] reach every waiter and are never cached.
+        """
+        entry = self._entries.get(key)
+        now = time.monotonic()
+
+        if entry is not None and now < entry.expires_at:
+            self.stats.hits += 1
+            self._entries.move_to_end(key)
+            return entry.value
+
+        if entry is not None and now < entry.expires_at + self.stale_ttl:
+            self.stats.stale_hits += 1
+            self._entries.move_to_end(key)
+            if self._running_fetch(key) is None:
+                self.stats.refreshes += 1
+                task = self._start_fetch(key, fetch)
+                task.add_done_callback(self._background_done)
+                self._background.add(task)
+            return entry.value
+
+        self.stats.misses += 1
+        task = self._running_fetch(key)
+        if task is not None:
+            self.stats.coalesced += 1
+        else:
+            task = self._start_fetch(key, fetch)
+        # Shielded: a cancelled caller stops waiting, the fetch goes on for the others and fills the cache
+        return await asyncio.shield(task)
+
+    def _running_fetch(self, key: Hashable) -> asyncio.Task:
+        task = self._inflight.get(key)
+        return task if task is not None and not task.get_loop().is_closed() else None
+
+    def _start_fetch(self, key: Hashable, fetch: Callable[[], Awaitable[Any]]) -> asyncio.Task:
+        """Runs [fetch] in a task of its own, registered as the in-flight fetch of [key] before this returns"""
+        task = asyncio.ensure_future(self._fetch(key, fetch))
+        self._inflight[key] = task
+        task.add_done_callback(lambda done: self._fetch_done(key, done))
+        return task
+
+    async def _fetch(self, key: Hashable, fetch: Callable[[], Awaitable[Any]]):
+        value = await fetch()
+        self.set(key, value)
+        return value
+
+    def _fetch_done(self, key: Hashable, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # Mark the exception as retrieved when every waiter was cancelled
+        if not task.cancelled():
+            task.exception()
+
+    def _background_done(self, task: asyncio.Task):
+        self._background.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            self.stats.refresh_errors += 1
+
+    def snapshot(self) -> dict:
+        """Returns counters and occupancy, used to size the cache"""
+        lookups = self.stats.hits + self.stats.stale_hits + self.stats.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "stale_ttl": self.stale_ttl,
+            "hits": self.stats.hits,
+            "stale_hits": self.stats.stale_hits,
+            "misses": self.stats.misses,
+            "coalesced": self.stats.coalesced,
+            "evictions": self.stats.evictions,
+            "refreshes": self.stats.refreshes,
+            "refresh_errors": self.stats.refresh_errors,
+            "hit_ratio": (self.stats.hits + self.stats.stale_hits) / lookups if lookups else 0.0
+        }
+
+#endregion ---- CACHE ---------------------------------------------------------------------------------------
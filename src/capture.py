@@ -0,0 +1,253 @@
+#region ------- IMPORTS -------------------------------------------------------------------------------------
+
+import hashlib
+import random
+import time
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from fnmatch import fnmatchcase
+from typing import Awaitable, Callable
+from starlette.datastructures import QueryParams
+from src.metrics import UNMATCHED_ROUTE
+
+#endregion ---- IMPORTS -------------------------------------------------------------------------------------
+
+#region ------- CONSTANTS -----------------------------------------------------------------------------------
+
+SAMPLING_MODES = ("head", "tail")
+
+# Appended to a stored body cut at the size cap
+TRUNCATION_MARKER = "...[truncated, {size} bytes]"
+
+#endregion ---- CONSTANTS -----------------------------------------------------------------------------------
+
+#region ------- UTILS ---------------------------------------------------------------------------------------
+
+def parse_patterns(spec: str) -> tuple:
+    """Parses comma-separated path globs (e.g. "/docs*,/openapi.json")"""
+    return tuple(pattern.strip() for pattern in (spec or "").split(",") if pattern.strip())
+
+def parse_rates(spec: str) -> tuple:
+    """Parses comma-separated glob=rate pairs (e.g. "/users=0.1,/todos*=0.5") into (glob, rate) tuples"""
+    rates = []
+    for item in parse_patterns(spec):
+        pattern, separator, rate = item.rpartition("=")
+        if not separator or not pattern.strip():
+            raise ValueError(f"Malformed sample rate [{item}], expected <route glob>=<rate>")
+        rates.append((pattern.strip(), float(rate)))
+    return tuple(rates)
+
+def matches(path: str, patterns: tuple) -> bool:
+    return any(fnmatchcase(path, pattern) for pattern in patterns)
+
+#endregion ---- UTILS ---------------------------------------------------------------------------------------
+
+#region ------- POLICY --------------------------------------------------------------------------------------
+
+@dataclass(frozen=True)
+class CapturePolicy:
+    """Which requests are logged, which of them are stored, and how much of their body
+
+    Parameters
+    ----------
+    include, exclude : tuple
+
+        Path globs: when [include] is set only matching paths are logged, paths matching [exclude] never are
+
+    rates : tuple
+
+        (glob, rate) pairs, the first one matching a path gives the fraction of its requests stored,
+        [default_rate] applies otherwise
+
+    mode : str
+
+        head - the sampling decision is taken when the request starts, and the body of a request not
+        sampled is not read at all; tail - it is taken once the response is known, reading every body
+
+    keep_status, slow_ms : int | float
+
+        Requests answered with a status from [keep_status] up, or slower than [slow_ms] (tail mode, 0 to
+        disable), are always stored
+
+    body_max_bytes : int
+
+        Bytes of the body stored, 0 to store none
+    """
+    include: tuple = ()
+    exclude: tuple = ()
+    rates: tuple = ()
+    default_rate: float = 1.0
+    mode: str = "head"
+    keep_status: int = 400
+    slow_ms: float = 0
+    body_max_bytes: int = 4096
+
+    def __post_init__(self):
+        if self.mode not in SAMPLING_MODES:
+            raise ValueError(f"Unknown sampling mode [{self.mode}], expected one of {SAMPLING_MODES}")
+
+    def captures(self, path: str) -> bool:
+        """Tells whether requests to [path] are logged at all (they then count in the rollups)"""
+        if self.include and not matches(path, self.include):
+            return False
+        return not matches(path, self.exclude)
+
+    def sample_rate(self, path: str) -> float:
+        for pattern, rate in self.rates:
+            if fnmatchcase(path, pattern):
+                return rate
+        return self.default_rate
+
+    def head_sample(self, path: str) -> bool:
+        """Sampling decision taken when the request starts: None in tail mode"""
+        if self.mode != "head":
+            return None
+        return random.random() < self.sample_rate(path)
+
+    def always_kept(self, status: int, duration_ms: float) -> bool:
+        """Tells whether a finished request is stored whatever the sampling: errors and slow requests are"""
+        return status >= self.keep_status or (self.slow_ms > 0 and duration_ms >= self.slow_ms)
+
+    def keep(self, path: str, status: int, duration_ms: float, sampled: bool = None) -> bool:
+        """Tells whether a finished request is stored"""
+        if self.always_kept(status, duration_ms):
+            return True
+        if sampled is not None:
+            return sampled
+        return random.random() < self.sample_rate(path)
+
+    def sample_weight(self, path: str, status: int, duration_ms: float) -> float:
+        """Number of requests a stored one stands for: 1 when always kept, else the inverse of the sample rate"""
+        rate = self.sample_rate(path)
+        return 1.0 if self.always_kept(status, duration_ms) or rate <= 0 else 1 / min(rate, 1.0)
+
+#endregion ---- POLICY --------------------------------------------------------------------------------------
+
+#region ------- BODY ----------------------------------------------------------------------------------------
+
+class BodyCapture:
+    """Keeps the first [max_bytes] of a request body and hashes all of it, as the application reads it
+
+    [prefetch] reads the body up to the cap before the application runs (so it is captured even when
+    the endpoint never reads it) and [receive] replays those messages, then passes the rest through:
+    at most [max_bytes] plus one chunk are ever held in memory.
+    """
+
+    def __init__(self, receive: Callable[[], Awaitable[dict]], max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.complete = False
+        self._receive = receive
+        self._pending = deque()
+        self._head = bytearray()
+        self._hash = hashlib.sha256()
+
+    def _feed(self, message: dict):
+        chunk = message.get("body", b"")
+        self.size += len(chunk)
+        self._hash.update(chunk)
+        if len(self._head) < self.max_bytes:
+            self._head.extend(chunk[: self.max_bytes - len(self._head)])
+        if not message.get("more_body", False):
+            self.complete = True
+
+    async def prefetch(self):
+        while not self.complete and self.size <= self.max_bytes:
+            message = await self._receive()
+            self._pending.append(message)
+            if message["type"] != "http.request":
+                return
+            self._feed(message)
+
+    async def receive(self) -> dict:
+        if self._pending:
+            return self._pending.popleft()
+        message = await self._receive()
+        if message["type"] == "http.request":
+            self._feed(message)
+        return message
+
+    @property
+    def truncated(self) -> bool:
+        return self.size > self.max_bytes
+
+    def text(self) -> str:
+        """The stored body: the captured bytes, with a marker giving the full size when they were cut"""
+        text = bytes(self._head).decode("utf-8", errors="replace")
+        if self.truncated:
+            text += TRUNCATION_MARKER.format(size=self.size if self.complete else f"over {self.max_bytes}")
+        return text
+
+    def sha256(self) -> str:
+        """Hex SHA-256 of the full body when it was truncated and entirely read, else None"""
+        return self._hash.hexdigest() if self.truncated and self.complete else None
+
+#endregion ---- BODY ----------------------------------------------------------------------------------------
+
+#region ------- MIDDLEWARE ----------------------------------------------------------------------------------
+
+class CaptureMiddleware:
+    """Pure ASGI middleware handing a log record of every captured request to [submit]
+
+    Records of requests the policy does not store are still submitted, flagged with keep=False, so the
+    rollups count all the traffic while only the stored requests are written as rows, with the number of
+    requests each one stands for (sample_weight) so the rollups can be rebuilt from them. Records carry
+    the raw path, which is stored, and the template of the matched route, which keys the rollups so that
+    unknown paths (404s, scanners) cannot grow their series.
+    """
+
+    def __init__(self, app, policy: CapturePolicy, submit: Callable[[dict], Awaitable[None]]):
+        self.app = app
+        self.policy = policy
+        self.submit = submit
+
+    async def __call__(self, scope, receive, send):
+        path = scope.get("path", "")
+        if scope["type"] != "http" or not self.policy.captures(path):
+            await self.app(scope, receive, send)
+            return
+
+        sampled = self.policy.head_sample(path)
+        body = None
+        if sampled is not False and self.policy.body_max_bytes > 0:
+            body = BodyCapture(receive, self.policy.body_max_bytes)
+            await body.prefetch()
+            receive = body.receive
+
+        status = 500
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception:
+            # Unhandled errors are answered with a 500 by the outer server error middleware
+            await self._record(scope, status, started, sampled, body)
+            raise
+        await self._record(scope, status, started, sampled, body)
+
+    async def _record(self, scope, status: int, started: float, sampled: bool, body: BodyCapture):
+        duration_ms = (time.perf_counter() - started) * 1000
+        keep = self.policy.keep(scope["path"], status, duration_ms, sampled)
+        client = scope.get("client")
+        await self.submit({
+            "type": scope["method"],
+            "route": scope["path"],
+            "route_template": getattr(scope.get("route"), "path", UNMATCHED_ROUTE),
+            "ip_sender": client[0] if client else None,
+            "query": str(QueryParams(scope.get("query_string", b""))),
+            "body": body.text() if keep and body is not None else None,
+            "body_sha256": body.sha256() if keep and body is not None else None,
+            "result_code": status,
+            "timestamp": datetime.now(timezone.utc),
+            "duration_ms": duration_ms,
+            "sample_weight": self.policy.sample_weight(scope["path"], status, duration_ms) if keep else None,
+            "keep": keep
+        })
+
+#endregion ---- MIDDLEWARE ----------------------------------------------------------------------------------
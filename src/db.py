@@ -0,0 +1,136 @@
+#region ------- IMPORTS -------------------------------------------------------------------------------------
+
+import asyncio
+import os
+from sqlalchemy import create_engine
+from sqlalchemy.engine import URL, Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker
+from src import config, metrics
+
+#endregion ---- IMPORTS -------------------------------------------------------------------------------------
+
+#region ------- CONSTANTS -----------------------------------------------------------------------------------
+
+# Async driver used for each backend by the request path
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite"
+}
+
+#endregion ---- CONSTANTS -----------------------------------------------------------------------------------
+
+#region ------- UTILS ---------------------------------------------------------------------------------------
+
+def normalize_url(url: str) -> URL:
+    """Parses [url], pinning plain postgresql:// URLs to psycopg2, the driver listed in the requirements"""
+    url = make_url(url)
+    if url.drivername in ("postgres", "postgresql"):
+        url = url.set(drivername="postgresql+psycopg2")
+    return url
+
+def async_url(url: str) -> URL:
+    """Returns [url] with the async driver of its backend"""
+    url = normalize_url(url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver known for [{backend}], expected one of {list(ASYNC_DRIVERS)}")
+    return url.set(drivername=ASYNC_DRIVERS[backend])
+
+def pool_options(url: URL) -> dict:
+    """Pool settings of the configuration applicable to [url]"""
+    options = {"pool_pre_ping": config.DB_POOL_PRE_PING}
+    # SQLite pools are per file and thread, sizing them is not supported
+    if url.get_backend_name() != "sqlite":
+        options.update(
+            pool_size=config.DB_POOL_SIZE,
+            max_overflow=config.DB_MAX_OVERFLOW,
+            pool_timeout=config.DB_POOL_TIMEOUT,
+            pool_recycle=config.DB_POOL_RECYCLE
+        )
+    return options
+
+def build_engine(url: str = None) -> Engine:
+    """Creates a sync engine for [url] (default DATABASE_URL), used by migrations and maintenance
+
+    Creating an engine opens no connection: the pool connects on first checkout.
+    """
+    url = normalize_url(url or config.DATABASE_URL)
+    engine = create_engine(url, **pool_options(url))
+    metrics.instrument_engine(engine, "sync")
+    return engine
+
+def build_async_engine(url: str = None) -> AsyncEngine:
+    """Creates an async engine for [url] (default DATABASE_URL), used by the request path and the log writer"""
+    url = async_url(url or config.DATABASE_URL)
+    engine = create_async_engine(url, **pool_options(url))
+    metrics.instrument_engine(engine.sync_engine, "async")
+    return engine
+
+#endregion ---- UTILS ---------------------------------------------------------------------------------------
+
+#region ------- ENGINE --------------------------------------------------------------------------------------
+
+# Engine of the current process, created on first use: importing the application opens no connection
+_engine = None
+_engine_pid = None
+_session_factory = sessionmaker(autocommit=False, autoflush=False)
+
+def get_engine() -> Engine:
+    """Returns the engine of the current process, creating it on first use
+
+    A process forked after the engine was created (e.g. a worker of a preloading server) gets its own
+    engine: the inherited pool is discarded without closing the connections, which belong to the parent.
+    """
+    global _engine, _engine_pid
+    if _engine is None or _engine_pid != os.getpid():
+        if _engine is not None:
+            _engine.dispose(close=False)
+        _engine = build_engine()
+        _engine_pid = os.getpid()
+    return _engine
+
+def create_session() -> Session:
+    """Opens a session on the engine of the current process"""
+    return _session_factory(bind=get_engine())
+
+def dispose_engine():
+    """Closes the connections of the current engine, the next use creates a new one"""
+    global _engine, _engine_pid
+    if _engine is not None and _engine_pid == os.getpid():
+        _engine.dispose()
+    _engine, _engine_pid = None, None
+
+# Async engine of the current process and event loop: async connections cannot be used from another loop
+_async_engine = None
+_async_owner = None
+_async_session_factory = async_sessionmaker(autoflush=False, expire_on_commit=False)
+
+def get_async_engine() -> AsyncEngine:
+    """Returns the async engine of the current process and event loop, creating it on first use
+
+    Outside the application lifespan (e.g. a TestClient used without a context manager) each request
+    may run on a new loop: the engine of a previous loop is then discarded without closing its
+    connections, which can only be closed from the loop that opened them.
+    """
+    global _async_engine, _async_owner
+    owner = (os.getpid(), asyncio.get_running_loop())
+    if _async_engine is None or _async_owner != owner:
+        if _async_engine is not None:
+            _async_engine.sync_engine.dispose(close=False)
+        _async_engine = build_async_engine()
+        _async_owner = owner
+    return _async_engine
+
+def create_async_session() -> AsyncSession:
+    """Opens an async session on the engine of the current process and event loop"""
+    return _async_session_factory(bind=get_async_engine())
+
+async def dispose_async_engine():
+    """Closes the connections of the current async engine, the next use creates a new one"""
+    global _async_engine, _async_owner
+    if _async_engine is not None and _async_owner == (os.getpid(), asyncio.get_running_loop()):
+        await _async_engine.dispose()
+    _async_engine, _async_owner = None, None
+
+#endregion ---- ENGINE --------------------------------------------------------------------------------------
@@ -0,0 +1,96 @@
+#region ------- IMPORTS -------------------------------------------------------------------------------------
+
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+from typing import AsyncIterable, AsyncIterator, Callable
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from src.log_queries import LogFilters, apply_filters
+from src.models import RequestLog, RequestRoute
+
+#endregion ---- IMPORTS -------------------------------------------------------------------------------------
+
+#region ------- CONSTANTS -----------------------------------------------------------------------------------
+
+EXPORT_FIELDS = ["id", "type", "route", "ip_sender", "query", "body", "body_sha256", "result_code", "timestamp", "duration_ms", "sample_weight"]
+
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv"
+}
+
+#endregion ---- CONSTANTS -----------------------------------------------------------------------------------
+
+#region ------- UTILS ---------------------------------------------------------------------------------------
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+def ndjson_lines(rows: list) -> bytes:
+    """Encodes rows as newline-delimited JSON"""
+    return "".join(json.dumps(row, default=_json_default) + "\n" for row in rows).encode("utf-8")
+
+async def encode_ndjson(chunks: AsyncIterable[list]) -> AsyncIterator[bytes]:
+    """Encodes each chunk of rows as newline-delimited JSON"""
+    async for rows in chunks:
+        yield ndjson_lines(rows)
+
+async def encode_csv(chunks: AsyncIterable[list]) -> AsyncIterator[bytes]:
+    """Encodes each chunk of rows as CSV, preceded by a header line"""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS)
+    writer.writeheader()
+    async for rows in chunks:
+        writer.writerows(rows)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+async def gzip_stream(pieces: AsyncIterable[bytes], level: int = 6) -> AsyncIterator[bytes]:
+    """Compresses a byte stream incrementally into a single gzip member"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    async for piece in pieces:
+        compressed = compressor.compress(piece)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+#endregion ---- UTILS ---------------------------------------------------------------------------------------
+
+#region ------- EXPORT --------------------------------------------------------------------------------------
+
+async def iter_log_chunks(session_factory: Callable[[], AsyncSession], filters: LogFilters, chunk_size: int) -> AsyncIterator[list]:
+    """Yields the logs matching [filters], oldest first, as lists of at most [chunk_size] dicts
+
+    Rows are read through a server-side cursor (where the driver supports it), so only one chunk is
+    held in memory at any time whatever the number of logs selected.
+    """
+    columns = [RequestRoute.path.label("route") if field == "route" else getattr(RequestLog, field) for field in EXPORT_FIELDS]
+    statement = select(*columns).join(RequestRoute, RequestRoute.id == RequestLog.route_id)
+    statement = apply_filters(statement, filters).order_by(RequestLog.timestamp, RequestLog.id)
+    async with session_factory() as session:
+        result = await session.stream(statement.execution_options(yield_per=chunk_size))
+        async for partition in result.mappings().partitions():
+            yield [dict(row) for row in partition]
+
+def export_stream(session_factory: Callable[[], AsyncSession], filters: LogFilters, format: str = "ndjson",
+                  compress: bool = False, chunk_size: int = 1000) -> AsyncIterator[bytes]:
+    """Returns the encoded (and optionally gzip-compressed) byte stream of the logs matching [filters]
+
+    The stream is an async generator: it is only advanced when the previous piece has been sent, so a
+    slow client slows down the database reads instead of making the worker buffer the export.
+    """
+    if format not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format [{format}], expected one of {list(EXPORT_FORMATS)}")
+    encode = encode_ndjson if format == "ndjson" else encode_csv
+    stream = encode(iter_log_chunks(session_factory, filters, chunk_size))
+    return gzip_stream(stream) if compress else stream
+
+#endregion ---- EXPORT --------------------------------------------------------------------------------------
@@ -0,0 +1,108 @@
+#region ------- IMPORTS -------------------------------------------------------------------------------------
+
+import base64
+import ipaddress
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from sqlalchemy import Select, false, select, tuple_
+from src.models import RequestLog, RequestRoute, normalize_method
+
+#endregion ---- IMPORTS -------------------------------------------------------------------------------------
+
+#region ------- MODEL ---------------------------------------------------------------------------------------
+
+@dataclass
+class LogFilters:
+    """Filters accepted by the request log endpoints, None means no filter"""
+    route: str = None
+    type: str = None
+    result_code: int = None
+    ip_sender: str = None
+    since: datetime = None
+    until: datetime = None
+
+#endregion ---- MODEL ---------------------------------------------------------------------------------------
+
+#region ------- UTILS ---------------------------------------------------------------------------------------
+
+def to_utc_naive(value: datetime) -> datetime:
+    """Converts [value] to the naive UTC representation stored in request_logs.timestamp"""
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+def encode_cursor(timestamp: datetime, log_id: int) -> str:
+    """Encodes the position right after a log as an opaque cursor"""
+    raw = f"{to_utc_naive(timestamp).isoformat()}|{log_id}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str) -> tuple:
+    """Decodes a cursor built by encode_cursor, raising ValueError when it is malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("utf-8")
+        timestamp, log_id = raw.split("|")
+        return datetime.fromisoformat(timestamp), int(log_id)
+    except Exception as exc:
+        raise ValueError(f"Malformed cursor [{cursor}]") from exc
+
+def serialize_log(log: RequestLog, route_paths: dict) -> dict:
+    """Returns the public representation of a request log, [route_paths] maps route ids to paths"""
+    return {
+        "id": log.id,
+        "type": log.type,
+        "route": route_paths.get(log.route_id),
+        "ip_sender": log.ip_sender,
+        "query": log.query,
+        "body": log.body,
+        "body_sha256": log.body_sha256,
+        "result_code": log.result_code,
+        "timestamp": log.timestamp,
+        "duration_ms": log.duration_ms,
+        "sample_weight": log.sample_weight
+    }
+
+#endregion ---- UTILS ---------------------------------------------------------------------------------------
+
+#region ------- QUERIES -------------------------------------------------------------------------------------
+
+def apply_filters(statement: Select, filters: LogFilters) -> Select:
+    """Adds the WHERE clauses matching [filters] to [statement]"""
+    if filters.route is not None:
+        route_id = select(RequestRoute.id).where(RequestRoute.path == filters.route).scalar_subquery()
+        statement = statement.where(RequestLog.route_id == route_id)
+    if filters.type is not None:
+        statement = statement.where(RequestLog.type == normalize_method(filters.type))
+    if filters.result_code is not None:
+        statement = statement.where(RequestLog.result_code == filters.result_code)
+    if filters.ip_sender is not None:
+        try:
+            ipaddress.ip_address(filters.ip_sender)
+        except ValueError:
+            # Only valid addresses are stored, nothing can match
+            return statement.where(false())
+        statement = statement.where(RequestLog.ip_sender == filters.ip_sender)
+    if filters.since is not None:
+        statement = statement.where(RequestLog.timestamp >= to_utc_naive(filters.since))
+    if filters.until is not None:
+        statement = statement.where(RequestLog.timestamp < to_utc_naive(filters.until))
+    return statement
+
+def page_query(filters: LogFilters, limit: int, cursor: str = None, offset: int = 0) -> Select:
+    """Builds the query for a page of logs, newest first
+
+    With a [cursor] the page starts right after the (timestamp, id) it encodes, so the database seeks
+    straight into the composite index whatever the page depth. [offset] is kept for compatibility and
+    still makes the database skip every earlier row.
+    """
+    statement = apply_filters(select(RequestLog), filters)
+    if cursor is not None:
+        timestamp, log_id = decode_cursor(cursor)
+        # The plain bound on timestamp lets PostgreSQL prune partitions, the row comparison breaks ties on id
+        statement = statement.where(RequestLog.timestamp <= timestamp)
+        statement = statement.where(tuple_(RequestLog.timestamp, RequestLog.id) < tuple_(timestamp, log_id))
+    statement = statement.order_by(RequestLog.timestamp.desc(), RequestLog.id.desc())
+    if offset:
+        statement = statement.offset(offset)
+    return statement.limit(limit)
+
+#endregion ---- QUERIES -------------------------------------------------------------------------------------
@@ -0,0 +1,291 @@
+#region ------- IMPORTS -------------------------------------------------------------------------------------
+
+import asyncio
+import logging
+import random
+import time
+from dataclasses import dataclass
+from typing import Callable
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from src import metrics
+from src.log_queries import to_utc_naive
+from src.models import RequestLog, normalize_method
+from src.route_dictionary import RouteDictionary
+
+#endregion ---- IMPORTS -------------------------------------------------------------------------------------
+
+#region ------- CONSTANTS -----------------------------------------------------------------------------------
+
+OVERFLOW_POLICIES = ("drop", "block", "sample")
+
+# Transactions attempted per batch before its records are counted as failed
+WRITE_ATTEMPTS = 2
+
+# Marker put on the queue to ask the writer to drain and exit
+_STOP = object()
+
+logger = logging.getLogger(__name__)
+
+#endregion ---- CONSTANTS -----------------------------------------------------------------------------------
+
+#region ------- MODEL ---------------------------------------------------------------------------------------
+
+@dataclass
+class WriterStats:
+    enqueued: int = 0
+    written: int = 0
+    not_stored: int = 0
+    dropped: int = 0
+    sampled_out: int = 0
+    failed: int = 0
+    batches: int = 0
+
+#endregion ---- MODEL ---------------------------------------------------------------------------------------
+
+#region ------- UTILS ---------------------------------------------------------------------------------------
+
+def encode_record(record: dict, route_ids: dict) -> dict:
+    """Converts a log record as built by the middleware to the compact request_logs row"""
+    return {
+        "type": normalize_method(record["type"]),
+        "route_id": route_ids[record["route"]],
+        "ip_sender": record["ip_sender"],
+        "query": record["query"],
+        "body": record["body"],
+        "body_sha256": record.get("body_sha256"),
+        "result_code": int(record["result_code"]),
+        "timestamp": to_utc_naive(record["timestamp"]),
+        "duration_ms": record.get("duration_ms"),
+        "sample_weight": record.get("sample_weight")
+    }
+
+#endregion ---- UTILS ---------------------------------------------------------------------------------------
+
+#region ------- WRITER --------------------------------------------------------------------------------------
+
+class LogWriter:
+    """Background writer persisting RequestLog records in bulk
+
+    The logging middleware hands records (dicts with the route path) to [submit], which only puts
+    them on a bounded queue. A background task takes them off the queue and writes them with a single
+    multi-row INSERT per batch, so request latency does not depend on the database commit latency.
+    Records flagged keep=False (not retained by the capture policy) are only handed to the batch hooks,
+    so the rollups still count them, and are not inserted.
+
+    Parameters
+    ----------
+    session_factory : Callable[[], AsyncSession]
+
+        Factory of async sessions used by the flushes
+
+    route_dictionary : RouteDictionary
+
+        Cache translating route paths to the ids stored in request_logs
+
+    queue_size : int
+
+        Maximum number of records waiting to be written
+
+    batch_size : int
+
+        Number of records that triggers a flush
+
+    flush_interval : float
+
+        Maximum seconds a record waits in a partial batch before being flushed
+
+    batch_hooks : list
+
+        Sync callables (session, batch) run in the transaction inserting each batch, e.g. to maintain aggregates
+
+    overflow_policy : str
+
+        drop - discard new records while the queue is full
+        block - make the request wait for room in the queue
+        sample - keep only [sample_rate] of the records once the queue is over [sample_watermark], drop when full
+    """
+
+    def __init__(self, session_factory: Callable[[], AsyncSession], route_dictionary: RouteDictionary, queue_size: int,
+                 batch_size: int, flush_interval: float, batch_hooks: list = None, overflow_policy: str = "drop", sample_rate: float = 0.1, sample_watermark: float = 0.8):
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy [{overflow_policy}], expected one of {OVERFLOW_POLICIES}")
+        self.session_factory = session_factory
+        self.route_dictionary = route_dictionary
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.batch_hooks = list(batch_hooks or [])
+        self.overflow_policy = overflow_policy
+        self.sample_rate = sample_rate
+        self.sample_watermark = sample_watermark
+        self.stats = WriterStats()
+        self._queue = None
+        self._task = None
+        self._loop = None
+        self._getter = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done() and self._loop is asyncio.get_running_loop()
+
+    async def start(self):
+        """Starts the background flush task on the running event loop"""
+        if self.running:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._getter = None
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Flushes every queued record and stops the background task"""
+        if not self.running:
+            return
+        await self._queue.put(_STOP)
+        await self._task
+        self._task = None
+
+    async def submit(self, record: dict):
+        """Queues [record] for writing according to the overflow policy"""
+        if not self.running:
+            await self.start()
+
+        if self.overflow_policy == "block":
+            await self._queue.put(record)
+            self.stats.enqueued += 1
+            return
+
+        if self.overflow_policy == "sample" and self._queue.qsize() >= self.queue_size * self.sample_watermark:
+            if random.random() >= self.sample_rate:
+                self.stats.sampled_out += 1
+                return
+
+        try:
+            self._queue.put_nowait(record)
+            self.stats.enqueued += 1
+        except asyncio.QueueFull:
+            self.stats.dropped += 1
+
+    async def _next(self, timeout: float = None):
+        """Takes the next item off the queue, keeping a pending get alive across timeouts so no item is lost"""
+        if self._getter is None:
+            self._getter = asyncio.ensure_future(self._queue.get())
+        done, _ = await asyncio.wait({self._getter}, timeout=timeout)
+        if not done:
+            raise asyncio.TimeoutError
+        getter, self._getter = self._getter, None
+        return getter.result()
+
+    async def _run(self):
+        batch = []
+        try:
+            while True:
+                item = await self._next()
+                stopping = item is _STOP
+                if not stopping:
+                    batch.append(item)
+                deadline = self._loop.time() + self.flush_interval
+
+                # Fill the batch until it is full, the interval elapses or a stop is requested
+                while not stopping and len(batch) < self.batch_size:
+                    try:
+                        item = self._queue.get_nowait()
+                    except asyncio.QueueEmpty:
+                        timeout = deadline - self._loop.time()
+                        if timeout <= 0:
+                            break
+                        try:
+                            item = await self._next(timeout)
+                        except asyncio.TimeoutError:
+                            break
+                    if item is _STOP:
+                        stopping = True
+                    else:
+                        batch.append(item)
+
+                # The batch is only cleared once written: a write interrupted by a cancellation is rolled back
+                # and the batch is written again by the final flush
+                if batch:
+                    await self._write(batch)
+                    batch = []
+                if stopping:
+                    batch = self._drain()
+                    while batch:
+                        await self._write(batch[: self.batch_size])
+                        batch = batch[self.batch_size :]
+                    return
+        finally:
+            # Cancelled with its event loop (e.g. shutdown without lifespan): the loop still runs until this task
+            # exits, persist what is left
+            batch.extend(self._drain())
+            if batch:
+                await self._write(batch)
+
+    def _drain(self) -> list:
+        records = []
+        getter, self._getter = self._getter, None
+        if getter is not None:
+            if getter.done() and not getter.cancelled():
+                records.append(getter.result())
+            else:
+                getter.cancel()
+        while True:
+            try:
+                records.append(self._queue.get_nowait())
+            except asyncio.QueueEmpty:
+                return [record for record in records if record is not _STOP]
+
+    async def _write(self, batch: list):
+        started = time.perf_counter()
+        stored = [record for record in batch if record.get("keep", True)]
+        try:
+            for attempt in range(WRITE_ATTEMPTS):
+                try:
+                    await self._write_once(batch, stored)
+                    break
+                except Exception:
+                    # A transient failure (e.g. a deadlock victim) rolls the whole transaction back: write it again
+                    if attempt + 1 >= WRITE_ATTEMPTS:
+                        raise
+                    logger.warning("Could not write %d request logs, retrying", len(batch), exc_info=True)
+        except Exception:
+            self.stats.failed += len(batch)
+            metrics.LOG_WRITE_RECORDS.inc("failed", amount=len(batch))
+            logger.exception("Could not write %d request logs", len(batch))
+        else:
+            self.stats.written += len(stored)
+            self.stats.not_stored += len(batch) - len(stored)
+            self.stats.batches += 1
+            metrics.LOG_WRITE_RECORDS.inc("written", amount=len(stored))
+            metrics.LOG_WRITE_RECORDS.inc("not_stored", amount=len(batch) - len(stored))
+        finally:
+            metrics.LOG_WRITE_LATENCY.observe(time.perf_counter() - started)
+
+    async def _write_once(self, batch: list, stored: list):
+        async with self.session_factory() as session:
+            # New paths are committed on their own, so a failed batch never leaves a cached id behind
+            route_ids = await session.run_sync(self.route_dictionary.get_ids, {record["route"] for record in stored})
+            await session.commit()
+            if stored:
+                await session.execute(insert(RequestLog), [encode_record(record, route_ids) for record in stored])
+            for hook in self.batch_hooks:
+                await session.run_sync(hook, batch)
+            await session.commit()
+
+    def snapshot(self) -> dict:
+        """Returns queue occupancy and write counters"""
+        return {
+            "queue_size": self._queue.qsize() if self._queue is not None else 0,
+            "queue_capacity": self.queue_size,
+            "overflow_policy": self.overflow_policy,
+            "enqueued": self.stats.enqueued,
+            "written": self.stats.written,
+            "not_stored": self.stats.not_stored,
+            "dropped": self.stats.dropped,
+            "sampled_out": self.stats.sampled_out,
+            "failed": self.stats.failed,
+            "batches": self.stats.batches
+        }
+
+#endregion ---- WRITER --------------------------------------------------------------------------------------
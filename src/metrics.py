@@ -0,0 +1,270 @@
+#region ------- IMPORTS -------------------------------------------------------------------------------------
+
+import asyncio
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+#endregion ---- IMPORTS -------------------------------------------------------------------------------------
+
+#region ------- CONSTANTS -----------------------------------------------------------------------------------
+
+# Upper bounds (seconds) of the latency histograms, from sub-millisecond cache hits to slow upstream calls
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Route label of requests matching no route, so unknown paths cannot grow the number of series
+UNMATCHED_ROUTE = "<unmatched>"
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+#endregion ---- CONSTANTS -----------------------------------------------------------------------------------
+
+#region ------- UTILS ---------------------------------------------------------------------------------------
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _labels(names: tuple, values: tuple, extra: str = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+#endregion ---- UTILS ---------------------------------------------------------------------------------------
+
+#region ------- METRICS -------------------------------------------------------------------------------------
+
+class Metric:
+    """Base of the metric types: a name, a help text and one series per combination of label values
+
+    Recording only takes a short uncontended lock (writes also happen from the log writer thread),
+    text formatting is deferred to the scrape.
+    """
+    type = None
+
+    def __init__(self, name: str, help: str, labelnames: tuple = (), registry: "Registry" = None):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def samples(self) -> list:
+        """Returns (suffix, label values, extra label, value) tuples of every series"""
+        raise NotImplementedError
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        for suffix, values, extra, value in self.samples():
+            lines.append(f"{self.name}{suffix}{_labels(self.labelnames, values, extra)} {_number(value)}")
+        return lines
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: tuple = (), registry: "Registry" = None):
+        super().__init__(name, help, labelnames, registry)
+        self._values = {}
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels) -> float:
+        return self._values.get(labels, 0)
+
+    def samples(self) -> list:
+        with self._lock:
+            return [("_total", labels, None, value) for labels, value in self._values.items()]
+
+class Gauge(Metric):
+    """Gauge set explicitly, or read from [function] at scrape time (a number, or a dict of label values tuples to numbers)"""
+    type = "gauge"
+
+    def __init__(self, name: str, help: str, labelnames: tuple = (), registry: "Registry" = None, function: Callable = None):
+        super().__init__(name, help, labelnames, registry)
+        self.function = function
+        self._values = {}
+
+    def set(self, value: float, *labels):
+        with self._lock:
+            self._values[labels] = value
+
+    def samples(self) -> list:
+        if self.function is not None:
+            value = self.function()
+            values = value if isinstance(value, dict) else {(): value}
+        else:
+            with self._lock:
+                values = dict(self._values)
+        return [("", labels, None, value) for labels, value in values.items() if value is not None]
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: tuple = (), registry: "Registry" = None, buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames, registry)
+        self.buckets = tuple(sorted(buckets))
+        self._counts = {}
+        self._sums = {}
+
+    def observe(self, value: float, *labels):
+        # Counts are stored per bucket and only made cumulative when rendered
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._counts.get(labels)
+            if counts is None:
+                counts = self._counts[labels] = [0] * (len(self.buckets) + 1)
+                self._sums[labels] = 0.0
+            counts[index] += 1
+            self._sums[labels] += value
+
+    def count(self, *labels) -> int:
+        return sum(self._counts.get(labels, ()))
+
+    def samples(self) -> list:
+        with self._lock:
+            series = [(labels, list(counts), self._sums[labels]) for labels, counts in self._counts.items()]
+        samples = []
+        for labels, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                samples.append(("_bucket", labels, f'le="{_number(bound)}"', cumulative))
+            samples.append(("_sum", labels, None, total))
+            samples.append(("_count", labels, None, cumulative))
+        return samples
+
+class Registry:
+    """Set of metrics rendered together in the Prometheus text format"""
+
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric: Metric):
+        # Registering a name again replaces the metric, so reloading a module does not fail
+        self._metrics[metric.name] = metric
+
+    def render(self) -> str:
+        return "\n".join(line for metric in self._metrics.values() for line in metric.render()) + "\n"
+
+REGISTRY = Registry()
+
+#endregion ---- METRICS -------------------------------------------------------------------------------------
+
+#region ------- INSTRUMENTS ---------------------------------------------------------------------------------
+
+REQUEST_LATENCY = Histogram("http_request_duration_seconds", "Latency of the API requests", ("method", "route", "status"))
+UPSTREAM_LATENCY = Histogram("upstream_request_duration_seconds", "Latency of the calls to the Mock API", ("path",))
+UPSTREAM_RESPONSES = Counter("upstream_responses", "Answers of the Mock API by status, error on transport failures", ("path", "status"))
+UPSTREAM_RETRIES = Counter("upstream_retries", "Retried calls to the Mock API", ("endpoint",))
+UPSTREAM_HEDGES = Counter("upstream_hedges", "Hedged calls to the Mock API, by whether the hedge answered first", ("endpoint", "outcome"))
+UPSTREAM_REJECTED = Counter("upstream_rejected", "Calls to the Mock API failed by the call policy, by reason", ("endpoint", "reason"))
+UPSTREAM_BREAKER_STATE = Gauge("upstream_breaker_state", "Circuit breaker of the Mock API endpoints: 0 closed, 1 half open, 2 open", ("endpoint",))
+UPSTREAM_STALE_SERVED = Counter("upstream_stale_served", "Answers served from the last cached data because the Mock API failed", ("endpoint",))
+LOG_WRITE_LATENCY = Histogram("log_write_duration_seconds", "Duration of the transaction writing a batch of request logs")
+LOG_WRITE_RECORDS = Counter("log_write_records", "Request logs written, only counted in the rollups (not_stored) or failed by the background writer", ("outcome",))
+POOL_CHECKOUT_WAIT = Histogram("db_pool_checkout_wait_seconds", "Time spent waiting for a database connection from the pool", ("engine",))
+LOOP_LAG = Histogram("event_loop_lag_seconds", "Delay of the event loop in running a timer, a measure of blocking code")
+
+#endregion ---- INSTRUMENTS ---------------------------------------------------------------------------------
+
+#region ------- MIDDLEWARE ----------------------------------------------------------------------------------
+
+class MetricsMiddleware:
+    """Pure ASGI middleware timing every HTTP request into [REQUEST_LATENCY]
+
+    Requests are labelled with the template of the matched route (e.g. /users), read from the scope
+    once the router has run, rather than with the raw path.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            REQUEST_LATENCY.observe(time.perf_counter() - started, scope["method"], getattr(route, "path", UNMATCHED_ROUTE), status)
+
+#endregion ---- MIDDLEWARE ----------------------------------------------------------------------------------
+
+#region ------- DATABASE ------------------------------------------------------------------------------------
+
+# Engines whose pool usage is exposed, by name
+_ENGINES = {}
+
+def _instrument_pool(pool, name: str):
+    # The pool has no event before a checkout starts, so the method acquiring a connection is timed instead
+    acquire = pool._do_get
+    def timed_acquire():
+        started = time.perf_counter()
+        try:
+            return acquire()
+        finally:
+            POOL_CHECKOUT_WAIT.observe(time.perf_counter() - started, name)
+    pool._do_get = timed_acquire
+
+def pool_usage(engine: Engine) -> dict:
+    """Returns connections in use, idle and beyond the configured size of the pool of [engine], and that size"""
+    pool = engine.pool
+    usage = {}
+    if hasattr(pool, "checkedout"):
+        usage["checked_out"] = pool.checkedout()
+    if hasattr(pool, "checkedin"):
+        usage["idle"] = pool.checkedin()
+    if hasattr(pool, "size"):
+        usage["size"] = pool.size()
+    if hasattr(pool, "overflow"):
+        # Negative while the pool has not opened [size] connections yet
+        usage["overflow"] = max(0, pool.overflow())
+    return usage
+
+def instrument_engine(engine: Engine, name: str):
+    """Times pool checkouts of [engine] (also after a dispose recreates its pool) and exposes its pool usage as [name]
+
+    An engine instrumented under the name of a previous one replaces it.
+    """
+    _instrument_pool(engine.pool, name)
+    event.listen(engine, "engine_disposed", lambda _: _instrument_pool(engine.pool, name))
+    _ENGINES[name] = engine
+
+POOL_CONNECTIONS = Gauge(
+    "db_pool_connections", "Connections of the database pools by state", ("engine", "state"),
+    function=lambda: {(name, state): value for name, engine in list(_ENGINES.items()) for state, value in pool_usage(engine).items()}
+)
+
+#endregion ---- DATABASE ------------------------------------------------------------------------------------
+
+#region ------- EVENT LOOP ----------------------------------------------------------------------------------
+
+async def monitor_loop_lag(interval: float):
+    """Measures every [interval] seconds how late the event loop wakes up a sleeping task, until cancelled"""
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        LOOP_LAG.observe(max(0.0, loop.time() - started - interval))
+
+#endregion ---- EVENT LOOP ----------------------------------------------------------------------------------
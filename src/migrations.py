@@ -0,0 +1,147 @@
+#region ------- IMPORTS -------------------------------------------------------------------------------------
+
+import argparse
+from datetime import datetime, timezone
+from sqlalchemy import MetaData, Table, delete, insert, inspect, select, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from src import config
+from src.log_writer import encode_record
+from src.models import Base, RequestLog
+from src.partitions import PARENT_TABLE, create_partitions, list_partitions, maintain
+from src.route_dictionary import RouteDictionary
+
+#endregion ---- IMPORTS -------------------------------------------------------------------------------------
+
+#region ------- CONSTANTS -----------------------------------------------------------------------------------
+
+# Name given to a request_logs table with the original (all strings) layout while it is converted
+LEGACY_TABLE = f"{PARENT_TABLE}_legacy"
+
+LEGACY_COLUMNS = ("type", "route", "ip_sender", "query", "body", "result_code", "timestamp", "duration_ms")
+
+#endregion ---- CONSTANTS -----------------------------------------------------------------------------------
+
+#region ------- MIGRATIONS ----------------------------------------------------------------------------------
+
+def add_missing_columns(engine: Engine):
+    """Adds to existing tables the nullable columns declared on the models but missing in the database"""
+    inspector = inspect(engine)
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing or not column.nullable:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                connection.execute(text(f'ALTER TABLE {table.name} ADD COLUMN "{column.name}" {column_type}'))
+
+def has_legacy_layout(engine: Engine) -> bool:
+    """Tells whether request_logs still stores the route path as a string"""
+    inspector = inspect(engine)
+    if not inspector.has_table(PARENT_TABLE):
+        return False
+    columns = {column["name"] for column in inspector.get_columns(PARENT_TABLE)}
+    return "route" in columns and "route_id" not in columns
+
+def swap_legacy_table(engine: Engine) -> bool:
+    """Moves a legacy request_logs aside and creates the compact one, in a single short transaction
+
+    The legacy table (with its partitions) is renamed to request_logs_legacy and its secondary indexes
+    are dropped, so their names are free for the new table. Renames are metadata-only: writers are
+    blocked for milliseconds and then insert into the compact table, while [copy_legacy_rows] moves
+    the old rows over in the background. Returns whether a swap happened.
+    """
+    if not has_legacy_layout(engine):
+        return False
+    inspector = inspect(engine)
+    if inspector.has_table(LEGACY_TABLE):
+        raise RuntimeError(f"{LEGACY_TABLE} already exists: finish the previous conversion with `python -m src.migrations compact`")
+    indexes = [index["name"] for index in inspector.get_indexes(PARENT_TABLE)]
+    primary_key = inspector.get_pk_constraint(PARENT_TABLE).get("name")
+
+    with engine.begin() as connection:
+        postgresql = connection.dialect.name == "postgresql"
+        children = list_partitions(connection) if postgresql else []
+        connection.execute(text(f"ALTER TABLE {PARENT_TABLE} RENAME TO {LEGACY_TABLE}"))
+        for index in indexes:
+            connection.execute(text(f"DROP INDEX {index}"))
+        if postgresql:
+            if primary_key:
+                connection.execute(text(f"ALTER TABLE {LEGACY_TABLE} RENAME CONSTRAINT {primary_key} TO {LEGACY_TABLE}_pkey"))
+            for child in children:
+                connection.execute(text(f"ALTER TABLE {child} RENAME TO {LEGACY_TABLE}{child[len(PARENT_TABLE):]}"))
+
+        Base.metadata.create_all(bind=connection)
+        if postgresql and config.LOG_PARTITIONING != "none":
+            create_partitions(connection, datetime.now(timezone.utc).date(), config.LOG_PARTITIONING, config.LOG_PARTITIONS_AHEAD)
+    return True
+
+def copy_legacy_rows(engine: Engine, batch_size: int, route_dictionary: RouteDictionary = None) -> int:
+    """Converts the rows of request_logs_legacy into request_logs, one batch per transaction
+
+    Each batch is inserted in the compact table and deleted from the legacy one in the same short
+    transaction, so the copy holds no long lock, can be interrupted at any time and resumed by running
+    it again. The emptied legacy table is dropped at the end. Returns the number of rows converted.
+    """
+    if not inspect(engine).has_table(LEGACY_TABLE):
+        return 0
+    route_dictionary = route_dictionary or RouteDictionary()
+    legacy = Table(LEGACY_TABLE, MetaData(), autoload_with=engine)
+    columns = [legacy.c[column] for column in LEGACY_COLUMNS if column in legacy.c]
+
+    converted = 0
+    while True:
+        with Session(engine) as session:
+            rows = session.execute(select(legacy.c.id, *columns).order_by(legacy.c.id).limit(batch_size)).mappings().all()
+            if not rows:
+                break
+            route_ids = route_dictionary.get_ids(session, {row["route"] for row in rows})
+            session.commit()
+            session.execute(insert(RequestLog), [encode_record(dict(row), route_ids) for row in rows])
+            session.execute(delete(legacy).where(legacy.c.id <= rows[-1]["id"]))
+            session.commit()
+        converted += len(rows)
+
+    legacy.drop(bind=engine)
+    return converted
+
+def upgrade(engine: Engine):
+    """Brings the schema up to date: creates missing tables, columns, indexes and upcoming partitions"""
+    swap_legacy_table(engine)
+    Base.metadata.create_all(bind=engine)
+    add_missing_columns(engine)
+
+    # Indexes added to an existing table are not created by create_all
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+    # Partitions must exist before the first log is written, retention is left to the periodic maintenance
+    maintain(engine, expire=False)
+
+#endregion ---- MIGRATIONS ----------------------------------------------------------------------------------
+
+#region ------- CLI -----------------------------------------------------------------------------------------
+
+def main(argv: list = None):
+    parser = argparse.ArgumentParser(description="Schema migrations of the request log tables")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("upgrade", help="Create missing tables, columns, indexes and partitions")
+    compact = commands.add_parser("compact", help="Convert a request_logs table with the legacy layout to the compact one")
+    compact.add_argument("--batch-size", type=int, default=config.MIGRATION_BATCH_SIZE, help="Rows converted per transaction")
+    args = parser.parse_args(argv)
+
+    from src.db import get_engine
+    engine = get_engine()
+    upgrade(engine)
+    if args.command == "compact":
+        converted = copy_legacy_rows(engine, args.batch_size)
+        print(f"Converted {converted} legacy request logs")
+
+if __name__ == "__main__":
+    main()
+
+#endregion ---- CLI -----------------------------------------------------------------------------------------
@@ -0,0 +1,177 @@
+#region ------- IMPORTS -------------------------------------------------------------------------------------
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from src.upstream import UpstreamClient, UpstreamError, decode_json
+
+#endregion ---- IMPORTS -------------------------------------------------------------------------------------
+
+#region ------- CONSTANTS -----------------------------------------------------------------------------------
+
+USERS_ENDPOINT = '/users'
+TODOS_ENDPOINT = '/todos'
+
+logger = logging.getLogger(__name__)
+
+#endregion ---- CONSTANTS -----------------------------------------------------------------------------------
+
+#region ------- MODEL ---------------------------------------------------------------------------------------
+
+@dataclass(frozen=True)
+class MirrorSnapshot:
+    """Immutable, indexed copy of the upstream dataset, replaced as a whole on every refresh"""
+    users: tuple
+    users_by_id: dict
+    todos_by_user: dict
+    refreshed_at: float
+    version: int
+
+@dataclass
+class Validators:
+    """Conditional request validators of an upstream resource and its last decoded body"""
+    etag: str = None
+    last_modified: str = None
+    data: list = field(default=None)
+
+#endregion ---- MODEL ---------------------------------------------------------------------------------------
+
+#region ------- MIRROR --------------------------------------------------------------------------------------
+
+class UpstreamMirror:
+    """In-process mirror of /users and /todos, refreshed periodically with conditional requests
+
+    Parameters
+    ----------
+    client : UpstreamClient
+
+        Client used for the refreshes
+
+    refresh_interval : float
+
+        Seconds between two refreshes
+
+    max_staleness : float
+
+        Age (seconds) over which the snapshot is no longer served, callers falling back to the upstream
+    """
+
+    def __init__(self, client: UpstreamClient, refresh_interval: float, max_staleness: float):
+        self.client = client
+        self.refresh_interval = refresh_interval
+        self.max_staleness = max_staleness
+        self.snapshot = None
+        self.last_attempt = None
+        self.last_error = None
+        self.consecutive_failures = 0
+        self._validators = {USERS_ENDPOINT: Validators(), TODOS_ENDPOINT: Validators()}
+        self._task = None
+
+    def age(self) -> float:
+        """Seconds since the data of the current snapshot was last confirmed by the upstream"""
+        return time.time() - self.snapshot.refreshed_at if self.snapshot is not None else None
+
+    def fresh_snapshot(self) -> MirrorSnapshot:
+        """Returns the current snapshot, or None when there is none or it is older than [max_staleness]"""
+        snapshot = self.snapshot
+        if snapshot is None or time.time() - snapshot.refreshed_at > self.max_staleness:
+            return None
+        return snapshot
+
+    async def _fetch(self, path: str) -> tuple:
+        """Fetches [path] conditionally, returning its data and whether it changed since the previous fetch"""
+        validators = self._validators[path]
+        headers = {}
+        if validators.data is not None:
+            if validators.etag:
+                headers["If-None-Match"] = validators.etag
+            if validators.last_modified:
+                headers["If-Modified-Since"] = validators.last_modified
+
+        response = await self.client.get(path, headers=headers)
+        if response.status_code == 304 and validators.data is not None:
+            return validators.data, False
+        if response.status_code != 200:
+            raise UpstreamError(f"Unexpected status {response.status_code} from {self.client.base_url}{path}", response.status_code)
+
+        # Decoded first: an invalid body must not update the validators of the data kept
+        data = decode_json(response)
+        validators.etag = response.headers.get("ETag")
+        validators.last_modified = response.headers.get("Last-Modified")
+        validators.data = data
+        return validators.data, True
+
+    async def refresh(self):
+        """Refreshes the mirror, swapping in a new snapshot only if the upstream data changed"""
+        self.last_attempt = time.time()
+        try:
+            (users, users_changed), (todos, todos_changed) = await asyncio.gather(
+                self._fetch(USERS_ENDPOINT), self._fetch(TODOS_ENDPOINT)
+            )
+        except Exception as exc:
+            self.consecutive_failures += 1
+            self.last_error = repr(exc)
+            raise
+
+        self.consecutive_failures = 0
+        self.last_error = None
+        current = self.snapshot
+        if current is not None and not users_changed and not todos_changed:
+            # Unchanged data: keep the indexes, only record that they were confirmed now
+            self.snapshot = MirrorSnapshot(current.users, current.users_by_id, current.todos_by_user, self.last_attempt, current.version)
+            return
+
+        users = tuple(sorted(users, key=lambda user: user["id"]))
+        todos_by_user = {}
+        for todo in sorted(todos, key=lambda todo: todo["id"]):
+            todos_by_user.setdefault(todo["userId"], []).append(todo)
+
+        # A single reference assignment: readers see either the previous snapshot or the new one, never a mix
+        self.snapshot = MirrorSnapshot(
+            users=users,
+            users_by_id={user["id"]: user for user in users},
+            todos_by_user={user_id: tuple(items) for user_id, items in todos_by_user.items()},
+            refreshed_at=self.last_attempt,
+            version=current.version + 1 if current is not None else 1
+        )
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await self.refresh()
+            except Exception:
+                logger.exception("Could not refresh the upstream mirror")
+
+    async def start(self):
+        """Loads the mirror once (failures are logged, requests then go upstream) and schedules the refreshes"""
+        try:
+            await self.refresh()
+        except Exception:
+            logger.exception("Could not load the upstream mirror, serving from upstream until the next refresh")
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def status(self) -> dict:
+        """Returns the state of the mirror, in particular how stale its data is"""
+        snapshot = self.snapshot
+        age = self.age()
+        return {
+            "ready": snapshot is not None,
+            "serving": self.fresh_snapshot() is not None,
+            "version": snapshot.version if snapshot is not None else None,
+            "age_seconds": age,
+            "refresh_interval": self.refresh_interval,
+            "max_staleness": self.max_staleness,
+            "users": len(snapshot.users) if snapshot is not None else 0,
+            "todos": sum(len(items) for items in snapshot.todos_by_user.values()) if snapshot is not None else 0,
+            "consecutive_failures": self.consecutive_failures,
+            "last_error": self.last_error
+        }
+
+#endregion ---- MIRROR --------------------------------------------------------------------------------------
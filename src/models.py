@@ -1,7 +1,11 @@
 #region ------- IMPORTS -------------------------------------------------------------------------------------
 
-from sqlalchemy import Column, Integer, String, DateTime
+import ipaddress
+from sqlalchemy import Column, Integer, SmallInteger, BigInteger, Float, String, DateTime, Enum, Index, LargeBinary
+from sqlalchemy.dialects.postgresql import INET
 from sqlalchemy.orm import declarative_base
+from sqlalchemy.types import TypeDecorator
+from src import config
 
 #endregion ---- IMPORTS -------------------------------------------------------------------------------------
 
@@ -10,20 +14,114 @@ from sqlalchemy.orm import declarative_base
 # Init base declarative class for SQL table
 Base = declarative_base()
 
+# PostgreSQL requires the partition key in the primary key of a partitioned table
+PARTITIONED = config.LOG_PARTITIONING != "none"
+
+# Methods stored natively in request_logs.type, anything else is stored as OTHER
+HTTP_METHODS = ("GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS", "TRACE", "CONNECT", "OTHER")
+
 #endregion ---- INIT ----------------------------------------------------------------------------------------
+
+#region ------- UTILS ---------------------------------------------------------------------------------------
+
+def normalize_method(method: str) -> str:
+    """Returns the value of request_logs.type for an HTTP method"""
+    method = method.upper()
+    return method if method in HTTP_METHODS else "OTHER"
+
+#endregion ---- UTILS ---------------------------------------------------------------------------------------
+
+#region ------- TYPES ---------------------------------------------------------------------------------------
+
+class IPAddress(TypeDecorator):
+    """IP address stored as a native inet on PostgreSQL and as 4/16 packed bytes elsewhere
+
+    Values that are not a valid IPv4/IPv6 address (e.g. the host of a test client) are stored as NULL.
+    """
+    impl = LargeBinary(16)
+    cache_ok = True
+
+    def load_dialect_impl(self, dialect):
+        if dialect.name == "postgresql":
+            return dialect.type_descriptor(INET())
+        return dialect.type_descriptor(LargeBinary(16))
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        try:
+            address = ipaddress.ip_address(value)
+        except ValueError:
+            return None
+        return str(address) if dialect.name == "postgresql" else address.packed
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        if isinstance(value, (bytes, memoryview)):
+            return str(ipaddress.ip_address(bytes(value)))
+        return str(value)
+
+#endregion ---- TYPES ---------------------------------------------------------------------------------------
 #region ------- MODEL ---------------------------------------------------------------------------------------
 
 # Table model for SQL db
 class RequestLog(Base):
     __tablename__ = 'request_logs'
 
-    id = Column(Integer, primary_key=True, index=True)
-    type = Column(String, nullable=False)
-    route = Column(String, nullable=False)
-    ip_sender = Column(String, nullable=False)
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    type = Column(Enum(*HTTP_METHODS, name="http_method"), nullable=False)
+    # Dictionary-encoded path, see RequestRoute (routes are never deleted, so no foreign key check on writes)
+    route_id = Column(Integer, nullable=False)
+    ip_sender = Column(IPAddress, nullable=True)
     query = Column(String, nullable=True)
     body = Column(String, nullable=True)
-    result_code = Column(String, nullable=False)
-    timestamp = Column(DateTime, nullable=False)
+    # Hex SHA-256 of the full request body, set when the stored body was truncated
+    body_sha256 = Column(String(64), nullable=True)
+    result_code = Column(SmallInteger, nullable=False)
+    timestamp = Column(DateTime, nullable=False, primary_key=PARTITIONED)
+    duration_ms = Column(Float, nullable=True)
+    # Number of requests the row stands for when the capture policy samples its route, NULL meaning 1
+    sample_weight = Column(Float, nullable=True)
+
+    # Composite indexes backing keyset pagination on (timestamp, id), alone or behind an equality filter
+    __table_args__ = (
+        Index("ix_request_logs_timestamp_id", "timestamp", "id"),
+        Index("ix_request_logs_route_id_timestamp_id", "route_id", "timestamp", "id"),
+        Index("ix_request_logs_type_timestamp_id", "type", "timestamp", "id"),
+        Index("ix_request_logs_result_code_timestamp_id", "result_code", "timestamp", "id"),
+        Index("ix_request_logs_ip_sender_timestamp_id", "ip_sender", "timestamp", "id"),
+        {"postgresql_partition_by": "RANGE (timestamp)"} if PARTITIONED else {}
+    )
+
+# Lookup table of the paths referenced by request_logs.route_id
+class RequestRoute(Base):
+    __tablename__ = 'request_routes'
+
+    id = Column(Integer, primary_key=True)
+    path = Column(String, nullable=False, unique=True)
+
+# Per-interval traffic aggregates, incrementally updated as logs are written
+class RequestLogRollup(Base):
+    __tablename__ = 'request_log_rollups'
+
+    bucket_start = Column(DateTime, primary_key=True)
+    route = Column(String, primary_key=True)
+    method = Column(String, primary_key=True)
+    status = Column(String, primary_key=True)
+    count = Column(BigInteger, nullable=False, default=0)
+    error_count = Column(BigInteger, nullable=False, default=0)
+    latency_sum_ms = Column(Float, nullable=False, default=0)
+    # Non-cumulative latency histogram, one column per upper bound (ms) declared in src.rollups.LATENCY_BUCKETS_MS
+    latency_le_5 = Column(BigInteger, nullable=False, default=0)
+    latency_le_10 = Column(BigInteger, nullable=False, default=0)
+    latency_le_25 = Column(BigInteger, nullable=False, default=0)
+    latency_le_50 = Column(BigInteger, nullable=False, default=0)
+    latency_le_100 = Column(BigInteger, nullable=False, default=0)
+    latency_le_250 = Column(BigInteger, nullable=False, default=0)
+    latency_le_500 = Column(BigInteger, nullable=False, default=0)
+    latency_le_1000 = Column(BigInteger, nullable=False, default=0)
+    latency_le_2500 = Column(BigInteger, nullable=False, default=0)
+    latency_le_inf = Column(BigInteger, nullable=False, default=0)
 
 #endregion ---- MODEL ---------------------------------------------------------------------------------------
\ No newline at end of file
@@ -0,0 +1,237 @@
+#region ------- IMPORTS -------------------------------------------------------------------------------------
+
+import argparse
+import asyncio
+import gzip
+import logging
+import os
+import re
+from datetime import date, datetime, timedelta, timezone
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+from src import config
+from src.log_export import ndjson_lines
+from src.models import RequestLog, RequestRoute
+
+#endregion ---- IMPORTS -------------------------------------------------------------------------------------
+
+#region ------- CONSTANTS -----------------------------------------------------------------------------------
+
+PARENT_TABLE = RequestLog.__tablename__
+DEFAULT_PARTITION = f"{PARENT_TABLE}_default"
+GRANULARITIES = ("daily", "weekly")
+
+# Partitions are named after the first day they hold, e.g. request_logs_p20240101
+PARTITION_NAME = re.compile(rf"^{PARENT_TABLE}_p(\d{{8}})$")
+
+# Arbitrary key of the advisory lock ensuring a single worker runs the maintenance at a time
+MAINTENANCE_LOCK_KEY = 7_301_842
+
+logger = logging.getLogger(__name__)
+
+#endregion ---- CONSTANTS -----------------------------------------------------------------------------------
+
+#region ------- UTILS ---------------------------------------------------------------------------------------
+
+def period_start(day: date, granularity: str) -> date:
+    """Returns the first day of the partition period containing [day] (weeks start on Monday)"""
+    return day - timedelta(days=day.weekday()) if granularity == "weekly" else day
+
+def period_length(granularity: str) -> timedelta:
+    return timedelta(days=7) if granularity == "weekly" else timedelta(days=1)
+
+def partition_name(start: date) -> str:
+    return f"{PARENT_TABLE}_p{start:%Y%m%d}"
+
+def parse_partition_name(name: str) -> date:
+    """Returns the first day held by a partition created by this module, or None for any other table"""
+    match = PARTITION_NAME.match(name)
+    return datetime.strptime(match.group(1), "%Y%m%d").date() if match else None
+
+def is_partitioned(connection: Connection) -> bool:
+    """Tells whether request_logs is a PostgreSQL partitioned table"""
+    return connection.scalar(text(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid "
+        "WHERE c.relname = :name AND pg_table_is_visible(c.oid))"
+    ), {"name": PARENT_TABLE})
+
+def list_partitions(connection: Connection) -> list:
+    """Returns the names of the partitions currently attached to request_logs"""
+    return connection.scalars(text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "JOIN pg_class p ON p.oid = i.inhparent WHERE p.relname = :name AND pg_table_is_visible(p.oid) ORDER BY c.relname"
+    ), {"name": PARENT_TABLE}).all()
+
+#endregion ---- UTILS ---------------------------------------------------------------------------------------
+
+#region ------- MAINTENANCE ---------------------------------------------------------------------------------
+
+def create_partition(connection: Connection, name: str, start: date, end: date, has_default: bool):
+    """Creates the partition [name] holding [start, end)
+
+    PostgreSQL refuses to create it while the default partition holds rows of that range, so the
+    default partition is detached, those rows are moved to the new partition and it is attached back.
+    """
+    bounds = {"start": start, "end": end}
+    if has_default and connection.scalar(text(
+        f"SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} WHERE timestamp >= :start AND timestamp < :end)"
+    ), bounds):
+        connection.execute(text(f"ALTER TABLE {PARENT_TABLE} DETACH PARTITION {DEFAULT_PARTITION}"))
+        connection.execute(text(f"CREATE TABLE {name} PARTITION OF {PARENT_TABLE} FOR VALUES FROM ('{start}') TO ('{end}')"))
+        moved = connection.execute(text(
+            f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE timestamp >= :start AND timestamp < :end RETURNING *) "
+            f"INSERT INTO {name} SELECT * FROM moved"
+        ), bounds).rowcount
+        connection.execute(text(f"ALTER TABLE {PARENT_TABLE} ATTACH PARTITION {DEFAULT_PARTITION} DEFAULT"))
+        logger.info("Moved %d rows from %s to the new partition %s", moved, DEFAULT_PARTITION, name)
+        return
+    connection.execute(text(
+        f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {PARENT_TABLE} FOR VALUES FROM ('{start}') TO ('{end}')"
+    ))
+
+def create_partitions(connection: Connection, today: date, granularity: str, ahead: int) -> list:
+    """Creates the partitions from the current period to [ahead] periods in the future, plus a default one
+
+    Each partition is created in its own savepoint: one that cannot be created is reported in the logs
+    without undoing the others.
+    """
+    created = []
+    existing = set(list_partitions(connection))
+    start = period_start(today, granularity)
+    for _ in range(ahead + 1):
+        end = start + period_length(granularity)
+        name = partition_name(start)
+        if name not in existing:
+            try:
+                with connection.begin_nested():
+                    create_partition(connection, name, start, end, DEFAULT_PARTITION in existing)
+                created.append(name)
+            except Exception:
+                logger.exception("Could not create partition %s", name)
+        start = end
+
+    # Rows outside every range (e.g. clock skew) land in the default partition instead of failing
+    if DEFAULT_PARTITION not in existing:
+        connection.execute(text(f"CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} PARTITION OF {PARENT_TABLE} DEFAULT"))
+        created.append(DEFAULT_PARTITION)
+    return created
+
+def archive_partition(connection: Connection, name: str, archive_dir: str, chunk_size: int = 10000) -> str:
+    """Writes every row of the table [name] to [archive_dir]/[name].ndjson.gz and returns the file path"""
+    os.makedirs(archive_dir, exist_ok=True)
+    path = os.path.join(archive_dir, f"{name}.ndjson.gz")
+    result = connection.execution_options(stream_results=True, yield_per=chunk_size).execute(
+        text(
+            f"SELECT p.id, p.type, r.path AS route, p.ip_sender, p.query, p.body, p.body_sha256, p.result_code, p.timestamp, p.duration_ms, p.sample_weight "
+            f"FROM {name} p LEFT JOIN {RequestRoute.__tablename__} r ON r.id = p.route_id ORDER BY p.timestamp, p.id"
+        )
+    )
+    # Write to a temporary file first, so a crash never leaves a truncated archive under the final name
+    with open(path + ".tmp", "wb") as file:
+        with gzip.GzipFile(fileobj=file, mode="wb") as archive:
+            for partition in result.mappings().partitions():
+                archive.write(ndjson_lines([dict(row) for row in partition]))
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(path + ".tmp", path)
+    return path
+
+def drop_partition(connection: Connection, name: str):
+    """Detaches the partition [name] from request_logs and drops it"""
+    connection.execute(text(f"ALTER TABLE {PARENT_TABLE} DETACH PARTITION {name}"))
+    connection.execute(text(f"DROP TABLE {name}"))
+
+def expire_partitions(engine: Engine, today: date, granularity: str, retention_days: int, archive_dir: str) -> list:
+    """Archives then drops every partition whose whole period is older than [retention_days]
+
+    Each partition is archived while still attached, then detached and dropped in one transaction:
+    the cost is per partition and not per row. A partition that cannot be archived stays attached
+    (and is reported in the logs), so the next pass tries it again.
+    """
+    expired = []
+    cutoff = today - timedelta(days=retention_days)
+    with engine.connect() as connection:
+        names = list_partitions(connection)
+    for name in names:
+        start = parse_partition_name(name)
+        if start is None or start + period_length(granularity) > cutoff:
+            continue
+        try:
+            with engine.connect() as connection:
+                path = archive_partition(connection, name, archive_dir)
+        except Exception:
+            logger.exception("Could not archive partition %s, it is kept until the next pass", name)
+            continue
+        with engine.begin() as connection:
+            drop_partition(connection, name)
+        logger.info("Archived partition %s to %s and dropped it", name, path)
+        expired.append(name)
+    return expired
+
+def maintain(engine: Engine, today: date = None, expire: bool = True) -> dict:
+    """Runs one maintenance pass: creates upcoming partitions and, with [expire], expires old ones
+
+    The pass is a no-op unless partitioning is configured and the database is PostgreSQL. An advisory
+    lock keeps concurrent passes (one per worker) from racing on the same DDL: periodic passes skip
+    when another one is running, startup passes wait for it.
+    """
+    granularity = config.LOG_PARTITIONING
+    report = {"created": [], "expired": []}
+    if granularity == "none":
+        return report
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"Unknown partitioning [{granularity}], expected none or one of {GRANULARITIES}")
+    if engine.dialect.name != "postgresql":
+        logger.warning("Partitioning of %s is only supported on PostgreSQL, skipping", PARENT_TABLE)
+        return report
+
+    today = today or datetime.now(timezone.utc).date()
+    with engine.connect() as lock:
+        if expire:
+            if not lock.scalar(text("SELECT pg_try_advisory_lock(:key)"), {"key": MAINTENANCE_LOCK_KEY}):
+                return report
+        else:
+            # At startup wait for the pass of another worker: logs must not be written before partitions exist
+            lock.execute(text("SELECT pg_advisory_lock(:key)"), {"key": MAINTENANCE_LOCK_KEY})
+        try:
+            with engine.begin() as connection:
+                if not is_partitioned(connection):
+                    raise RuntimeError(
+                        f"{PARENT_TABLE} exists but is not partitioned: rename it and recreate the schema to enable partitioning"
+                    )
+                report["created"] = create_partitions(connection, today, granularity, config.LOG_PARTITIONS_AHEAD)
+            if expire and config.LOG_RETENTION_DAYS > 0:
+                report["expired"] = expire_partitions(engine, today, granularity, config.LOG_RETENTION_DAYS, config.LOG_ARCHIVE_DIR)
+        finally:
+            lock.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": MAINTENANCE_LOCK_KEY})
+            lock.commit()
+    return report
+
+async def run_periodically(engine: Engine, interval: int):
+    """Runs [maintain] in a worker thread every [interval] seconds until cancelled"""
+    while True:
+        try:
+            await asyncio.to_thread(maintain, engine)
+        except Exception:
+            logger.exception("Partition maintenance failed")
+        await asyncio.sleep(interval)
+
+#endregion ---- MAINTENANCE ---------------------------------------------------------------------------------
+
+#region ------- CLI -----------------------------------------------------------------------------------------
+
+def main(argv: list = None):
+    parser = argparse.ArgumentParser(description="Maintenance of the request_logs partitions")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("maintain", help="Create upcoming partitions, archive and drop expired ones")
+    parser.parse_args(argv)
+
+    from src.db import get_engine
+    report = maintain(get_engine())
+    print(f"Created partitions: {report['created'] or 'none'}")
+    print(f"Expired partitions: {report['expired'] or 'none'}")
+
+if __name__ == "__main__":
+    main()
+
+#endregion ---- CLI -----------------------------------------------------------------------------------------
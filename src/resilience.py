@@ -0,0 +1,273 @@
+#region ------- IMPORTS -------------------------------------------------------------------------------------
+
+import asyncio
+import random
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable
+from src import config, metrics
+from src.upstream import UpstreamError
+
+#endregion ---- IMPORTS -------------------------------------------------------------------------------------
+
+#region ------- EXCEPTIONS ----------------------------------------------------------------------------------
+
+class DeadlineExceeded(UpstreamError):
+    """Raised when an upstream call, retries included, does not complete within its deadline"""
+
+class CircuitOpenError(UpstreamError):
+    """Raised without calling the upstream while its circuit breaker is open"""
+
+#endregion ---- EXCEPTIONS ----------------------------------------------------------------------------------
+
+#region ------- CONSTANTS -----------------------------------------------------------------------------------
+
+# Values of the breaker state gauge
+BREAKER_STATES = {"closed": 0, "half_open": 1, "open": 2}
+
+# Upstream statuses worth retrying, on top of transport errors
+RETRYABLE_STATUSES = (429, 500, 502, 503, 504)
+
+#endregion ---- CONSTANTS -----------------------------------------------------------------------------------
+
+#region ------- POLICY --------------------------------------------------------------------------------------
+
+@dataclass(frozen=True)
+class CallPolicy:
+    """How calls to one upstream endpoint are bounded, retried, short-circuited and hedged"""
+    deadline: float = 3.0
+    max_attempts: int = 3
+    backoff: float = 0.05
+    backoff_max: float = 1.0
+    budget_ratio: float = 0.2
+    budget_min_per_second: float = 1.0
+    breaker_failures: int = 5
+    breaker_reset: float = 10.0
+    hedge: bool = False
+    hedge_quantile: float = 0.95
+    hedge_min_delay: float = 0.01
+
+    @classmethod
+    def from_config(cls, endpoint: str) -> "CallPolicy":
+        """Reads the policy of [endpoint], where UPSTREAM_<ENDPOINT>_<SETTING> overrides UPSTREAM_<SETTING>"""
+        prefix = f"UPSTREAM_{endpoint.upper()}_"
+        return cls(
+            deadline=config.env_float(prefix + "DEADLINE", config.UPSTREAM_DEADLINE),
+            max_attempts=config.env_int(prefix + "MAX_ATTEMPTS", config.UPSTREAM_MAX_ATTEMPTS),
+            backoff=config.env_float(prefix + "RETRY_BACKOFF", config.UPSTREAM_RETRY_BACKOFF),
+            backoff_max=config.env_float(prefix + "RETRY_BACKOFF_MAX", config.UPSTREAM_RETRY_BACKOFF_MAX),
+            budget_ratio=config.env_float(prefix + "RETRY_BUDGET_RATIO", config.UPSTREAM_RETRY_BUDGET_RATIO),
+            budget_min_per_second=config.env_float(prefix + "RETRY_BUDGET_MIN_PER_SECOND", config.UPSTREAM_RETRY_BUDGET_MIN_PER_SECOND),
+            breaker_failures=config.env_int(prefix + "BREAKER_FAILURES", config.UPSTREAM_BREAKER_FAILURES),
+            breaker_reset=config.env_float(prefix + "BREAKER_RESET_SECONDS", config.UPSTREAM_BREAKER_RESET_SECONDS),
+            hedge=config.env_bool(prefix + "HEDGE", config.UPSTREAM_HEDGE),
+            hedge_quantile=config.env_float(prefix + "HEDGE_QUANTILE", config.UPSTREAM_HEDGE_QUANTILE),
+            hedge_min_delay=config.env_float(prefix + "HEDGE_MIN_DELAY", config.UPSTREAM_HEDGE_MIN_DELAY)
+        )
+
+class RetryBudget:
+    """Token bucket capping retries (and hedges) to a fraction of the calls
+
+    Every call deposits [ratio] tokens and every retry spends one, so retries can never multiply the
+    load on an unhealthy upstream by more than 1 + [ratio]. [min_per_second] tokens are added over time
+    so that a low traffic endpoint can still retry.
+    """
+
+    def __init__(self, ratio: float, min_per_second: float, max_tokens: float = 10.0):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.max_tokens = max_tokens
+        self.tokens = max_tokens
+        self._refilled_at = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.max_tokens, self.tokens + (now - self._refilled_at) * self.min_per_second)
+        self._refilled_at = now
+
+    def deposit(self):
+        self._refill()
+        self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def try_spend(self) -> bool:
+        self._refill()
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+class CircuitBreaker:
+    """Opens after [failures] consecutive failed attempts and lets a single probe through after [reset] seconds"""
+
+    def __init__(self, name: str, failures: int, reset: float):
+        self.name = name
+        self.failures = failures
+        self.reset = reset
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self._probing = False
+        self._set_state("closed")
+
+    def _set_state(self, state: str):
+        self.state = state
+        metrics.UPSTREAM_BREAKER_STATE.set(BREAKER_STATES[state], self.name)
+
+    def allow(self) -> bool:
+        """Tells whether a call may go to the upstream now"""
+        if self.state == "closed":
+            return True
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.reset:
+            self._set_state("half_open")
+        if self.state == "half_open" and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def record_success(self):
+        self.consecutive_failures = 0
+        self._probing = False
+        if self.state != "closed":
+            self._set_state("closed")
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        self._probing = False
+        if self.state == "half_open" or self.consecutive_failures >= self.failures:
+            self.opened_at = time.monotonic()
+            self._set_state("open")
+
+class LatencyWindow:
+    """Latencies of the last successful attempts, to derive the hedging delay"""
+
+    def __init__(self, size: int = 256):
+        self._values = deque(maxlen=size)
+
+    def observe(self, value: float):
+        self._values.append(value)
+
+    def quantile(self, fraction: float) -> float:
+        if len(self._values) < 20:
+            return None
+        ordered = sorted(self._values)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+#endregion ---- POLICY --------------------------------------------------------------------------------------
+
+#region ------- CALLER --------------------------------------------------------------------------------------
+
+def is_retryable(exc: UpstreamError) -> bool:
+    return exc.status_code is None or exc.status_code in RETRYABLE_STATUSES
+
+class ResilientCaller:
+    """Applies a [CallPolicy] to the calls of one upstream endpoint
+
+    Parameters
+    ----------
+    name : str
+
+        Endpoint name, used in metrics
+
+    policy : CallPolicy
+
+        Deadline, retries, breaker and hedging settings
+    """
+
+    def __init__(self, name: str, policy: CallPolicy):
+        self.name = name
+        self.policy = policy
+        self.budget = RetryBudget(policy.budget_ratio, policy.budget_min_per_second)
+        self.breaker = CircuitBreaker(name, policy.breaker_failures, policy.breaker_reset)
+        self.latencies = LatencyWindow()
+
+    @classmethod
+    def from_config(cls, name: str) -> "ResilientCaller":
+        return cls(name, CallPolicy.from_config(name))
+
+    async def call(self, fetch: Callable[[], Awaitable[Any]]):
+        """Returns the result of [fetch], retried and hedged within the deadline, unless the breaker is open
+
+        Raises CircuitOpenError without calling [fetch] while the breaker is open, DeadlineExceeded when
+        the deadline elapses, or the UpstreamError of the last attempt.
+        """
+        if not self.breaker.allow():
+            metrics.UPSTREAM_REJECTED.inc(self.name, "circuit_open")
+            raise CircuitOpenError(f"Circuit breaker of [{self.name}] is open", 503)
+        self.budget.deposit()
+        try:
+            return await asyncio.wait_for(self._call(fetch), self.policy.deadline)
+        except asyncio.TimeoutError:
+            self.breaker.record_failure()
+            metrics.UPSTREAM_REJECTED.inc(self.name, "deadline")
+            raise DeadlineExceeded(f"Deadline of {self.policy.deadline}s exceeded calling [{self.name}]", 504) from None
+        except asyncio.CancelledError:
+            # A cancelled half-open probe must not keep the breaker waiting for its outcome forever
+            self.breaker._probing = False
+            raise
+
+    async def _call(self, fetch: Callable[[], Awaitable[Any]]):
+        for attempt in range(self.policy.max_attempts):
+            try:
+                result = await self._attempt(fetch)
+            except UpstreamError as exc:
+                if not is_retryable(exc):
+                    # The upstream answered: it is healthy even if the request was not
+                    self.breaker.record_success()
+                    raise
+                self.breaker.record_failure()
+                if attempt + 1 >= self.policy.max_attempts or self.breaker.state == "open":
+                    raise
+                if not self.budget.try_spend():
+                    metrics.UPSTREAM_REJECTED.inc(self.name, "budget_exhausted")
+                    raise
+                metrics.UPSTREAM_RETRIES.inc(self.name)
+                # Full jitter: concurrent callers spread their retries instead of hitting the upstream together
+                await asyncio.sleep(random.uniform(0, min(self.policy.backoff_max, self.policy.backoff * 2 ** attempt)))
+            else:
+                self.breaker.record_success()
+                return result
+
+    async def _timed(self, fetch: Callable[[], Awaitable[Any]]):
+        started = time.perf_counter()
+        result = await fetch()
+        self.latencies.observe(time.perf_counter() - started)
+        return result
+
+    async def _attempt(self, fetch: Callable[[], Awaitable[Any]]):
+        """Runs [fetch], and with hedging a second copy when the first is slower than the recent quantile"""
+        if not self.policy.hedge:
+            return await self._timed(fetch)
+
+        delay = max(self.policy.hedge_min_delay, self.latencies.quantile(self.policy.hedge_quantile) or 0)
+        primary = asyncio.ensure_future(self._timed(fetch))
+        hedge = None
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            if done or not self.budget.try_spend():
+                return await primary
+
+            hedge = asyncio.ensure_future(self._timed(fetch))
+            pending = {primary, hedge}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    # Keep waiting for the other copy when the first one to complete failed
+                    if task.exception() is None or not pending:
+                        metrics.UPSTREAM_HEDGES.inc(self.name, "won" if task is hedge else "lost")
+                        return task.result()
+        finally:
+            # On a deadline or a cancelled caller, no copy may keep calling the upstream in the background
+            for task in (primary, hedge):
+                if task is not None and not task.done():
+                    task.cancel()
+
+    def snapshot(self) -> dict:
+        """Returns the breaker state, retry budget and hedging delay of the endpoint"""
+        return {
+            "breaker": self.breaker.state,
+            "consecutive_failures": self.breaker.consecutive_failures,
+            "retry_tokens": round(self.budget.tokens, 2),
+            "hedge_delay": self.latencies.quantile(self.policy.hedge_quantile) if self.policy.hedge else None
+        }
+
+#endregion ---- CALLER --------------------------------------------------------------------------------------
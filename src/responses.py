@@ -0,0 +1,143 @@
+#region ------- IMPORTS -------------------------------------------------------------------------------------
+
+import gzip
+import hashlib
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Callable, Hashable
+import orjson
+from fastapi import Request, Response
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+#endregion ---- IMPORTS -------------------------------------------------------------------------------------
+
+#region ------- MODEL ---------------------------------------------------------------------------------------
+
+@dataclass
+class SerializedPage:
+    """JSON bytes of a page with their strong ETag, and the compressed variants built so far"""
+    source: object
+    body: bytes
+    etag: str
+    encoded: dict = field(default_factory=dict)
+
+#endregion ---- MODEL ---------------------------------------------------------------------------------------
+
+#region ------- UTILS ---------------------------------------------------------------------------------------
+
+COMPRESSORS = {"gzip": lambda body: gzip.compress(body, compresslevel=6, mtime=0)}
+if brotli is not None:
+    COMPRESSORS["br"] = lambda body: brotli.compress(body, quality=5)
+
+# Preferred encoding first when the client accepts several with the same weight
+ENCODING_PREFERENCE = ("br", "gzip")
+
+def make_etag(body: bytes) -> str:
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+def variant_etag(etag: str, encoding: str) -> str:
+    """Strong ETags identify a representation, so each compressed variant gets its own"""
+    return etag if encoding == "identity" else f'{etag[:-1]}-{encoding}"'
+
+def choose_encoding(accept_encoding: str) -> str:
+    """Returns the best encoding among the supported ones accepted by the client, or identity"""
+    weights = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        name = name.strip().lower()
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            weights[name] = quality
+
+    best, best_quality = "identity", 0.0
+    for encoding in ENCODING_PREFERENCE:
+        quality = weights.get(encoding, weights.get("*", 0.0))
+        if encoding in COMPRESSORS and quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Weak comparison of [etag] against an If-None-Match header, as required for GET"""
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+#endregion ---- UTILS ---------------------------------------------------------------------------------------
+
+#region ------- CACHE ---------------------------------------------------------------------------------------
+
+class PageCache:
+    """LRU cache of serialized pages, each valid as long as the data it was sliced from is the same object
+
+    Upstream data is shared by reference (the TTL cache and the mirror hand out the same list until it
+    is refreshed), so comparing identities is enough to know a page is current, without hashing data.
+
+    Parameters
+    ----------
+    max_entries : int
+
+        Maximum number of pages kept, the least recently used one is evicted first
+
+    min_compress_bytes : int
+
+        Size under which a page is always sent uncompressed
+    """
+
+    def __init__(self, max_entries: int, min_compress_bytes: int):
+        self.max_entries = max_entries
+        self.min_compress_bytes = min_compress_bytes
+        self._pages = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._pages)
+
+    def get(self, key: Hashable, source: object, build: Callable[[], object]) -> SerializedPage:
+        """Returns the page cached for [key], serializing [build]() again if [source] changed since"""
+        page = self._pages.get(key)
+        if page is None or page.source is not source:
+            body = orjson.dumps(build())
+            page = SerializedPage(source=source, body=body, etag=make_etag(body))
+            self._pages[key] = page
+            while len(self._pages) > self.max_entries:
+                self._pages.popitem(last=False)
+        self._pages.move_to_end(key)
+        return page
+
+    def respond(self, request: Request, key: Hashable, source: object, build: Callable[[], object], headers: dict = None) -> Response:
+        """Builds the response of a cached page: 304 when the client has it, else the best accepted encoding"""
+        return self._send(request, self.get(key, source, build), headers)
+
+    def render(self, request: Request, data: object, headers: dict = None) -> Response:
+        """Builds the response of a page serialized for this request only, with the same ETag and encoding handling"""
+        body = orjson.dumps(data)
+        return self._send(request, SerializedPage(source=data, body=body, etag=make_etag(body)), headers)
+
+    def _send(self, request: Request, page: SerializedPage, headers: dict = None) -> Response:
+        encoding = "identity"
+        if len(page.body) >= self.min_compress_bytes:
+            encoding = choose_encoding(request.headers.get("accept-encoding", ""))
+
+        etag = variant_etag(page.etag, encoding)
+        headers = {**(headers or {}), "ETag": etag, "Vary": "Accept-Encoding"}
+        if etag_matches(request.headers.get("if-none-match", ""), etag):
+            return Response(status_code=304, headers=headers)
+
+        body = page.body
+        if encoding != "identity":
+            if encoding not in page.encoded:
+                page.encoded[encoding] = COMPRESSORS[encoding](page.body)
+            body = page.encoded[encoding]
+            headers["Content-Encoding"] = encoding
+        return Response(content=body, media_type="application/json", headers=headers)
+
+#endregion ---- CACHE ---------------------------------------------------------------------------------------
@@ -0,0 +1,232 @@
+#region ------- IMPORTS -------------------------------------------------------------------------------------
+
+import argparse
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from typing import Callable, Iterable
+from sqlalchemy import delete, select
+from sqlalchemy.orm import Session
+from src import config
+from src.log_queries import to_utc_naive
+from src.metrics import UNMATCHED_ROUTE
+from src.models import RequestLog, RequestLogRollup, RequestRoute, normalize_method
+
+#endregion ---- IMPORTS -------------------------------------------------------------------------------------
+
+#region ------- CONSTANTS -----------------------------------------------------------------------------------
+
+# Upper bounds (ms) of the latency histogram buckets, the last column collects everything above
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+LATENCY_COLUMNS = [f"latency_le_{bound}" for bound in LATENCY_BUCKETS_MS] + ["latency_le_inf"]
+
+KEY_COLUMNS = ["bucket_start", "route", "method", "status"]
+COUNTER_COLUMNS = ["count", "error_count", "latency_sum_ms"] + LATENCY_COLUMNS
+
+EPOCH = datetime(1970, 1, 1)
+
+#endregion ---- CONSTANTS -----------------------------------------------------------------------------------
+
+#region ------- UTILS ---------------------------------------------------------------------------------------
+
+def bucket_start(timestamp: datetime, interval: int = None) -> datetime:
+    """Returns the (naive UTC) start of the rollup interval containing [timestamp]"""
+    interval = interval or config.ROLLUP_INTERVAL_SECONDS
+    seconds = int((to_utc_naive(timestamp) - EPOCH).total_seconds())
+    return EPOCH + timedelta(seconds=seconds - seconds % interval)
+
+def latency_column(duration_ms: float) -> str:
+    for bound, column in zip(LATENCY_BUCKETS_MS, LATENCY_COLUMNS):
+        if duration_ms <= bound:
+            return column
+    return LATENCY_COLUMNS[-1]
+
+def route_matcher(routes: Iterable) -> Callable[[str], str]:
+    """Returns a function giving the template of the first of [routes] matching a raw path, or UNMATCHED_ROUTE"""
+    patterns = [(route.path_regex, route.path) for route in routes if hasattr(route, "path_regex")]
+
+    @lru_cache(maxsize=10000)
+    def match(path: str) -> str:
+        for regex, template in patterns:
+            if regex.match(path):
+                return template
+        return UNMATCHED_ROUTE
+    return match
+
+def serialize_rollup(rollup: RequestLogRollup) -> dict:
+    """Returns the public representation of a rollup row"""
+    observed = sum(getattr(rollup, column) for column in LATENCY_COLUMNS)
+    histogram = {str(bound): getattr(rollup, column) for bound, column in zip(LATENCY_BUCKETS_MS, LATENCY_COLUMNS)}
+    histogram["+Inf"] = rollup.latency_le_inf
+    return {
+        "bucket_start": rollup.bucket_start,
+        "route": rollup.route,
+        "method": rollup.method,
+        "status": rollup.status,
+        "count": rollup.count,
+        "error_count": rollup.error_count,
+        "avg_latency_ms": rollup.latency_sum_ms / observed if observed else None,
+        "latency_histogram_ms": histogram
+    }
+
+#endregion ---- UTILS ---------------------------------------------------------------------------------------
+
+#region ------- AGGREGATION ---------------------------------------------------------------------------------
+
+def aggregate(records: Iterable[dict], weighted: bool = False, aggregates: dict = None) -> dict:
+    """Folds log records (dicts with route path, method and status) into rollup counters keyed on KEY_COLUMNS
+
+    Records are keyed on their route_template when they have one (as built by the capture middleware),
+    else on their route.
+
+    With [weighted], each record counts for its sample_weight (stored logs of a sampled route stand for
+    the requests that were not stored), otherwise for one. Counters are added to [aggregates] if given.
+    """
+    aggregates = {} if aggregates is None else aggregates
+    for record in records:
+        weight = (record.get("sample_weight") or 1) if weighted else 1
+        status = str(record["result_code"])
+        route = record.get("route_template") or record["route"]
+        key = (bucket_start(record["timestamp"]), route, normalize_method(record["type"]), status)
+        counters = aggregates.get(key)
+        if counters is None:
+            counters = aggregates[key] = dict.fromkeys(COUNTER_COLUMNS, 0)
+        counters["count"] += weight
+        if int(status) >= config.ROLLUP_ERROR_STATUS:
+            counters["error_count"] += weight
+        duration_ms = record.get("duration_ms")
+        if duration_ms is not None:
+            counters["latency_sum_ms"] += duration_ms * weight
+            counters[latency_column(duration_ms)] += weight
+    return aggregates
+
+def round_counts(aggregates: dict) -> dict:
+    """Rounds the weighted counts of [aggregates] to the integers stored in the rollup table"""
+    for counters in aggregates.values():
+        for column in COUNTER_COLUMNS:
+            if column != "latency_sum_ms":
+                counters[column] = round(counters[column])
+    return aggregates
+
+def apply_aggregates(session: Session, aggregates: dict):
+    """Adds [aggregates] to the rollup table with a single upsert where the dialect supports it"""
+    if not aggregates:
+        return
+    # Rows are upserted in key order, so concurrent writers lock the same rows in the same order and cannot deadlock
+    rows = [dict(zip(KEY_COLUMNS, key), **counters) for key, counters in sorted(aggregates.items(), key=lambda item: item[0])]
+    table = RequestLogRollup.__table__
+    dialect = session.get_bind().dialect.name
+
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        # No portable upsert: read-modify-write under the current transaction
+        for row in rows:
+            rollup = session.get(RequestLogRollup, tuple(row[column] for column in KEY_COLUMNS))
+            if rollup is None:
+                session.add(RequestLogRollup(**row))
+            else:
+                for column in COUNTER_COLUMNS:
+                    setattr(rollup, column, getattr(rollup, column) + row[column])
+        return
+
+    statement = insert(table).values(rows)
+    statement = statement.on_conflict_do_update(
+        index_elements=KEY_COLUMNS,
+        set_={column: table.c[column] + statement.excluded[column] for column in COUNTER_COLUMNS}
+    )
+    session.execute(statement)
+
+def record_batch(session: Session, batch: list):
+    """Log writer hook: updates the rollups in the same transaction that inserts [batch]"""
+    apply_aggregates(session, aggregate(batch))
+
+#endregion ---- AGGREGATION ---------------------------------------------------------------------------------
+
+#region ------- QUERIES -------------------------------------------------------------------------------------
+
+def stats_query(since: datetime, until: datetime, route: str = None, method: str = None, status: int = None, limit: int = 1000):
+    """Builds the query reading rollups in [since, until), its cost depends on the range and not on the raw log volume"""
+    statement = select(RequestLogRollup).where(
+        RequestLogRollup.bucket_start >= bucket_start(since),
+        RequestLogRollup.bucket_start < to_utc_naive(until)
+    )
+    if route is not None:
+        statement = statement.where(RequestLogRollup.route == route)
+    if method is not None:
+        statement = statement.where(RequestLogRollup.method == method.upper())
+    if status is not None:
+        statement = statement.where(RequestLogRollup.status == str(status))
+    order = [RequestLogRollup.bucket_start, RequestLogRollup.route, RequestLogRollup.method, RequestLogRollup.status]
+    return statement.order_by(*order).limit(limit)
+
+#endregion ---- QUERIES -------------------------------------------------------------------------------------
+
+#region ------- BACKFILL ------------------------------------------------------------------------------------
+
+def backfill(session_factory: Callable[[], Session], since: datetime = None, until: datetime = None, chunk_size: int = 10000,
+             route_template: Callable[[str], str] = None) -> int:
+    """Rebuilds the rollups of [since, until) from the raw request logs in a single transaction
+
+    Bounds are aligned to the rollup intervals. [until] defaults to the start of the current interval,
+    so the logs the live writer is still adding are not counted twice. Logs are counted for their
+    sample_weight, so requests the capture policy did not store are estimated from the sampled ones.
+    Logs store the raw path: [route_template] (see route_matcher) maps it to the route template keying
+    the live rollups. Returns the number of logs read.
+    """
+    until = bucket_start(until or datetime.now(timezone.utc))
+    since = bucket_start(since) if since is not None else None
+    columns = (
+        RequestLog.timestamp, RequestRoute.path.label("route"), RequestLog.type, RequestLog.result_code,
+        RequestLog.duration_ms, RequestLog.sample_weight
+    )
+
+    with session_factory() as session:
+        clear = delete(RequestLogRollup).where(RequestLogRollup.bucket_start < until)
+        logs = select(*columns).join(RequestRoute, RequestRoute.id == RequestLog.route_id)
+        logs = logs.where(RequestLog.timestamp < until).order_by(RequestLog.timestamp)
+        if since is not None:
+            clear = clear.where(RequestLogRollup.bucket_start >= since)
+            logs = logs.where(RequestLog.timestamp >= since)
+        session.execute(clear)
+
+        # Stream the logs in chunks and upsert the intervals each chunk completes, so memory does not grow
+        # with the table; weighted counts are only rounded once their interval is complete
+        processed, pending = 0, {}
+        result = session.execute(logs.execution_options(yield_per=chunk_size))
+        for chunk in result.partitions():
+            records = [row._asdict() for row in chunk]
+            if route_template is not None:
+                for record in records:
+                    record["route_template"] = route_template(record["route"])
+            aggregate(records, weighted=True, aggregates=pending)
+            processed += len(chunk)
+            current = bucket_start(chunk[-1].timestamp)
+            complete = {key: counters for key, counters in pending.items() if key[0] < current}
+            pending = {key: counters for key, counters in pending.items() if key[0] >= current}
+            apply_aggregates(session, round_counts(complete))
+        apply_aggregates(session, round_counts(pending))
+        session.commit()
+    return processed
+
+def main(argv: list = None):
+    parser = argparse.ArgumentParser(description="Maintenance of the request log rollups")
+    commands = parser.add_subparsers(dest="command", required=True)
+    rebuild = commands.add_parser("backfill", help="Rebuild the rollups from the existing request logs")
+    rebuild.add_argument("--since", type=datetime.fromisoformat, default=None, help="Start of the range (ISO format, UTC)")
+    rebuild.add_argument("--until", type=datetime.fromisoformat, default=None, help="End of the range (ISO format, UTC)")
+    rebuild.add_argument("--chunk-size", type=int, default=10000, help="Number of logs read per chunk")
+    args = parser.parse_args(argv)
+
+    from src.db import create_session
+    from src.main import app
+    processed = backfill(
+        create_session, since=args.since, until=args.until, chunk_size=args.chunk_size, route_template=route_matcher(app.routes)
+    )
+    print(f"Rebuilt rollups from {processed} request logs")
+
+if __name__ == "__main__":
+    main()
+
+#endregion ---- BACKFILL ------------------------------------------------------------------------------------
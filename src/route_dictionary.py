@@ -0,0 +1,110 @@
+#region ------- IMPORTS -------------------------------------------------------------------------------------
+
+import threading
+from collections import OrderedDict
+from typing import Iterable
+from sqlalchemy import insert, select
+from sqlalchemy.orm import Session
+from src.models import RequestRoute
+
+#endregion ---- IMPORTS -------------------------------------------------------------------------------------
+
+#region ------- CONSTANTS -----------------------------------------------------------------------------------
+
+# Appended to a path cut at the maximum length
+CUT_MARKER = "..."
+
+#endregion ---- CONSTANTS -----------------------------------------------------------------------------------
+
+#region ------- DICTIONARY ----------------------------------------------------------------------------------
+
+class RouteDictionary:
+    """Maps request paths to the small integer ids stored in request_logs.route_id
+
+    Mappings are cached in process (bounded, least recently used first out), so the database is only
+    queried the first time a path or id is seen. Paths are never deleted nor renumbered, which makes
+    cached entries valid forever and safe to share between threads and workers. Paths longer than
+    [max_length] are stored cut, with a marker, so long unknown paths cannot bloat the table.
+    """
+
+    def __init__(self, max_entries: int = 10000, max_length: int = 256):
+        self.max_entries = max_entries
+        self.max_length = max_length
+        self._ids = OrderedDict()
+        self._paths = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _remember(self, path: str, route_id: int):
+        with self._lock:
+            self._ids[path] = route_id
+            self._paths[route_id] = path
+            self._ids.move_to_end(path)
+            self._paths.move_to_end(route_id)
+            while len(self._ids) > self.max_entries:
+                self._ids.popitem(last=False)
+            while len(self._paths) > self.max_entries:
+                self._paths.popitem(last=False)
+
+    def _cached(self, cache: OrderedDict, keys: Iterable) -> tuple:
+        found, missing = {}, []
+        with self._lock:
+            for key in keys:
+                if key in cache:
+                    found[key] = cache[key]
+                    cache.move_to_end(key)
+                else:
+                    missing.append(key)
+        return found, missing
+
+    def cut(self, path: str) -> str:
+        """Returns [path] as stored: cut with a marker when longer than [max_length]"""
+        if len(path) <= self.max_length:
+            return path
+        return path[:max(0, self.max_length - len(CUT_MARKER))] + CUT_MARKER
+
+    def get_ids(self, session: Session, paths: Iterable[str]) -> dict:
+        """Returns {path: id} for [paths], registering the ones never seen before (long ones cut)"""
+        stored = {path: self.cut(path) for path in set(paths)}
+        ids = self._get_ids(session, set(stored.values()))
+        return {path: ids[cut_path] for path, cut_path in stored.items()}
+
+    def _get_ids(self, session: Session, paths: set) -> dict:
+        ids, missing = self._cached(self._ids, paths)
+        if not missing:
+            return ids
+
+        dialect = session.get_bind().dialect.name
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        elif dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        else:
+            dialect_insert = None
+
+        known = dict(session.execute(select(RequestRoute.path, RequestRoute.id).where(RequestRoute.path.in_(missing))).all())
+        unknown = [path for path in missing if path not in known]
+        if unknown:
+            # Concurrent writers may register the same path: the unique constraint keeps a single id
+            rows = [{"path": path} for path in unknown]
+            if dialect_insert is not None:
+                session.execute(dialect_insert(RequestRoute).values(rows).on_conflict_do_nothing(index_elements=["path"]))
+            else:
+                session.execute(insert(RequestRoute), rows)
+            known.update(session.execute(select(RequestRoute.path, RequestRoute.id).where(RequestRoute.path.in_(unknown))).all())
+
+        for path, route_id in known.items():
+            self._remember(path, route_id)
+        ids.update(known)
+        return ids
+
+    def get_paths(self, session: Session, ids: Iterable[int]) -> dict:
+        """Returns {id: path} for [ids]"""
+        paths, missing = self._cached(self._paths, set(ids))
+        if missing:
+            known = dict(session.execute(select(RequestRoute.id, RequestRoute.path).where(RequestRoute.id.in_(missing))).all())
+            for route_id, path in known.items():
+                self._remember(path, route_id)
+            paths.update(known)
+        return paths
+
+#endregion ---- DICTIONARY ----------------------------------------------------------------------------------
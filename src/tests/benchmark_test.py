@@ -0,0 +1,50 @@
+#region ------- IMPORTS -------------------------------------------------------------------------------------
+
+import asyncio
+import httpx
+from src.benchmark import compare, drive, percentile
+from src.upstream_stub import create_stub_app
+
+#endregion ---- IMPORTS -------------------------------------------------------------------------------------
+
+#region ------- UTILS ---------------------------------------------------------------------------------------
+
+def run_drive(error_rate: float) -> dict:
+    transport = httpx.ASGITransport(app=create_stub_app(error_rate=error_rate, seed=1))
+    endpoints = ["/users", "/todos?userId={user_id}"]
+    return asyncio.run(drive("http://stub.test", endpoints, concurrency=4, requests=40, transport=transport))
+
+def build_results(p95_ms: float, throughput_rps: float) -> dict:
+    return {"variants": {"logging": {"/users": {"p95_ms": p95_ms, "throughput_rps": throughput_rps}}}}
+
+#endregion ---- UTILS ---------------------------------------------------------------------------------------
+
+#region ------- TESTS ---------------------------------------------------------------------------------------
+
+# Test the load generator reports every request per endpoint
+def test_drive():
+    report = run_drive(error_rate=0)
+    assert report["all"]["requests"] == 40, f"Error in load - Expected 40 requests, got {report['all']['requests']}"
+    assert report["/todos"]["requests"] == 20, f"Error in per endpoint report - Expected 20 requests, got {report['/todos']['requests']}"
+    assert report["/users"]["p99_ms"] is not None, "Error in report - Missing latency percentiles"
+
+# Test injected upstream errors are counted and left out of latencies
+def test_error_injection():
+    report = run_drive(error_rate=1)
+    assert report["all"]["errors"] == 40, f"Error in error injection - Expected 40 errors, got {report['all']['errors']}"
+    assert report["all"]["p50_ms"] is None, f"Error in report - Expected no latency, got {report['all']['p50_ms']}"
+
+# Test nearest-rank percentiles
+def test_percentile():
+    values = list(range(1, 101))
+    assert percentile(values, 0.5) == 50, f"Error in p50 - Expected 50, got {percentile(values, 0.5)}"
+    assert percentile(values, 0.99) == 99, f"Error in p99 - Expected 99, got {percentile(values, 0.99)}"
+    assert percentile([7], 0.95) == 7, f"Error in single value - Expected 7, got {percentile([7], 0.95)}"
+
+# Test only regressions beyond the tolerance are reported
+def test_compare():
+    baseline = build_results(p95_ms=10, throughput_rps=1000)
+    assert compare(build_results(11, 950), baseline, 0.15) == [], "Error in compare - Change within tolerance reported"
+    assert len(compare(build_results(20, 500), baseline, 0.15)) == 2, "Error in compare - Expected latency and throughput regressions"
+
+#endregion ---- TESTS ---------------------------------------------------------------------------------------
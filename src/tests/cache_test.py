@@ -0,0 +1,108 @@
+#region ------- IMPORTS -------------------------------------------------------------------------------------
+
+import asyncio
+import pytest
+from src.cache import TTLCache
+
+#endregion ---- IMPORTS -------------------------------------------------------------------------------------
+
+#region ------- TESTS ---------------------------------------------------------------------------------------
+
+# Test concurrent misses on the same key trigger a single fetch
+def test_single_flight():
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return [1, 2, 3]
+
+    async def scenario():
+        cache = TTLCache(ttl=60, stale_ttl=0, max_entries=10)
+        results = await asyncio.gather(*[cache.get_or_fetch("users", fetch) for _ in range(500)])
+        return cache, results
+
+    cache, results = asyncio.run(scenario())
+    assert len(calls) == 1, f"Error in coalescing - Expected 1 fetch, got {len(calls)}"
+    assert all(result == [1, 2, 3] for result in results), "Error in coalescing - Waiters received a different value"
+    assert cache.stats.coalesced == 499, f"Error in counters - Expected 499 coalesced, got {cache.stats.coalesced}"
+
+# Test least recently used keys are evicted over the size limit
+def test_lru_eviction():
+    cache = TTLCache(ttl=60, stale_ttl=0, max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    asyncio.run(cache.get_or_fetch("a", None))
+    cache.set("c", 3)
+    assert cache.peek("b") is None, "Error in eviction - Expected least recently used key to be evicted"
+    assert cache.peek("a") == 1 and cache.peek("c") == 3, "Error in eviction - Expected recent keys to be kept"
+    assert cache.stats.evictions == 1, f"Error in counters - Expected 1 eviction, got {cache.stats.evictions}"
+
+# Test expired entries are served stale while a background refresh runs
+def test_stale_while_revalidate():
+    async def scenario():
+        cache = TTLCache(ttl=0, stale_ttl=60, max_entries=10)
+        cache.set("users", "old")
+
+        async def fetch():
+            return "new"
+
+        stale = await cache.get_or_fetch("users", fetch)
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        return cache, stale
+
+    cache, stale = asyncio.run(scenario())
+    assert stale == "old", f"Error in stale serving - Expected old value, got {stale}"
+    assert cache.peek("users") == "new", f"Error in revalidation - Expected new value, got {cache.peek('users')}"
+
+# Test fetch errors reach the caller and are not cached
+def test_errors_not_cached():
+    async def failing():
+        raise ValueError("upstream down")
+
+    cache = TTLCache(ttl=60, stale_ttl=0, max_entries=10)
+    with pytest.raises(ValueError):
+        asyncio.run(cache.get_or_fetch("users", failing))
+    assert cache.peek("users") is None, "Error in error handling - Failure should not be cached"
+
+# Test cancelling the caller that started a fetch does not cancel the callers coalesced on it
+def test_leader_cancellation():
+    async def fetch():
+        await asyncio.sleep(0.01)
+        return "value"
+
+    async def scenario():
+        cache = TTLCache(ttl=60, stale_ttl=0, max_entries=10)
+        leader = asyncio.ensure_future(cache.get_or_fetch("users", fetch))
+        follower = asyncio.ensure_future(cache.get_or_fetch("users", fetch))
+        await asyncio.sleep(0)
+        leader.cancel()
+        return cache, await follower
+
+    cache, value = asyncio.run(scenario())
+    assert value == "value", f"Error in coalescing - Expected the follower to get the value, got {value}"
+    assert cache.peek("users") == "value", "Error in coalescing - The fetch should complete and be cached"
+
+# Test concurrent stale hits schedule a single background refresh
+def test_single_refresh():
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "new"
+
+    async def scenario():
+        cache = TTLCache(ttl=0, stale_ttl=60, max_entries=10)
+        cache.set("users", "old")
+        for _ in range(5):
+            await cache.get_or_fetch("users", fetch)
+        await asyncio.sleep(0.02)
+        return cache
+
+    cache = asyncio.run(scenario())
+    assert len(calls) == 1, f"Error in revalidation - Expected 1 refresh, got {len(calls)}"
+    assert cache.stats.refreshes == 1, f"Error in counters - Expected 1 refresh, got {cache.stats.refreshes}"
+
+#endregion ---- TESTS ---------------------------------------------------------------------------------------
@@ -0,0 +1,103 @@
+#region ------- IMPORTS -------------------------------------------------------------------------------------
+
+import hashlib
+import pytest
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.testclient import TestClient
+from src.capture import CaptureMiddleware, CapturePolicy, parse_rates
+
+#endregion ---- IMPORTS -------------------------------------------------------------------------------------
+
+#region ------- UTILS ---------------------------------------------------------------------------------------
+
+def build_client(policy: CapturePolicy, records: list) -> TestClient:
+    app = FastAPI()
+
+    @app.get("/items")
+    async def get_items():
+        return []
+
+    @app.post("/echo")
+    async def echo(request: Request):
+        return {"size": len(await request.body())}
+
+    @app.get("/fail")
+    async def fail():
+        raise HTTPException(status_code=500, detail="failure")
+
+    async def submit(record: dict):
+        records.append(record)
+
+    app.add_middleware(CaptureMiddleware, policy=policy, submit=submit)
+    return TestClient(app)
+
+#endregion ---- UTILS ---------------------------------------------------------------------------------------
+
+#region ------- TESTS ---------------------------------------------------------------------------------------
+
+# Test include and exclude globs, and per-route rates with the first matching rule winning
+def test_routes():
+    policy = CapturePolicy(exclude=("/docs*", "/db_logs*"), rates=parse_rates("/todos/batch=0.5,/todos*=0.1"), default_rate=0.8)
+    assert not policy.captures("/db_logs/export"), "Error in exclusion - /db_logs/export should not be captured"
+    assert policy.captures("/users"), "Error in exclusion - /users should be captured"
+    assert policy.sample_rate("/todos/batch") == 0.5, f"Error in rates - Expected 0.5, got {policy.sample_rate('/todos/batch')}"
+    assert policy.sample_rate("/todos") == 0.1, f"Error in rates - Expected 0.1, got {policy.sample_rate('/todos')}"
+    assert policy.sample_rate("/users") == 0.8, f"Error in rates - Expected the default 0.8, got {policy.sample_rate('/users')}"
+    assert not CapturePolicy(include=("/users",)).captures("/todos"), "Error in inclusion - /todos should not be captured"
+    with pytest.raises(ValueError):
+        parse_rates("/users")
+
+# Test requests not sampled are counted but not stored, while errors are always stored
+def test_sampling():
+    for mode in ("head", "tail"):
+        records = []
+        client = build_client(CapturePolicy(default_rate=0, mode=mode), records)
+        client.get("/items")
+        client.get("/fail")
+        assert [record["keep"] for record in records] == [False, True], f"Error in {mode} sampling - Got {[record['keep'] for record in records]}"
+        assert records[1]["result_code"] == 500, f"Error in {mode} sampling - Expected status 500, got {records[1]['result_code']}"
+
+# Test sampled records stand for the inverse of their rate, while records always kept stand for themselves
+def test_sample_weight():
+    records = []
+    client = build_client(CapturePolicy(rates=parse_rates("/items=0.25,/fail=0.25"), default_rate=0), records)
+    while not records or not records[-1]["keep"]:
+        client.get("/items")
+    client.get("/fail")
+    assert records[-2]["sample_weight"] == 4, f"Error in sample weight - Expected 4, got {records[-2]['sample_weight']}"
+    assert records[-1]["sample_weight"] == 1, f"Error in sample weight - Expected 1 for an error, got {records[-1]['sample_weight']}"
+    assert all(record["sample_weight"] is None for record in records if not record["keep"]), "Error in sample weight - Set on a record not stored"
+
+# Test bodies over the cap are truncated with a marker and the hash of the full body, and still reach the endpoint
+def test_body_cap():
+    records = []
+    client = build_client(CapturePolicy(body_max_bytes=10), records)
+    payload = b"x" * 100_000
+    response = client.post("/echo", content=payload)
+    assert response.json() == {"size": 100_000}, f"Error in body replay - Expected the whole body, got {response.json()}"
+    assert records[0]["body"] == "x" * 10 + "...[truncated, 100000 bytes]", f"Error in body cap - Got {records[0]['body'][:50]}"
+    assert records[0]["body_sha256"] == hashlib.sha256(payload).hexdigest(), "Error in body cap - Hash of the full body mismatch"
+
+    client.post("/echo", content=b"short")
+    assert records[1]["body"] == "short" and records[1]["body_sha256"] is None, f"Error in body cap - Got {records[1]['body']}"
+
+# Test bodies of requests not sampled in head mode are not read
+def test_head_sampling_skips_body():
+    records = []
+    client = build_client(CapturePolicy(default_rate=0, mode="head"), records)
+    client.post("/echo", content=b"payload")
+    assert records[0]["body"] is None, f"Error in head sampling - Expected no body, got {records[0]['body']}"
+
+# Test records keep the raw path and carry the matched route template, paths matching no route being collapsed
+def test_route_templates():
+    records = []
+    client = build_client(CapturePolicy(), records)
+    client.get("/items")
+    client.get("/wp-login.php")
+    client.get("/.env")
+    routes = [record["route"] for record in records]
+    templates = [record["route_template"] for record in records]
+    assert routes == ["/items", "/wp-login.php", "/.env"], f"Error in raw paths - Got {routes}"
+    assert templates == ["/items", "<unmatched>", "<unmatched>"], f"Error in route templates - Got {templates}"
+
+#endregion ---- TESTS ---------------------------------------------------------------------------------------
@@ -0,0 +1,52 @@
+#region ------- IMPORTS -------------------------------------------------------------------------------------
+
+import asyncio
+import pytest
+from sqlalchemy import create_engine, func, insert, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from src.log_writer import encode_record
+from src.models import Base, RequestLog
+from src.route_dictionary import RouteDictionary
+
+#endregion ---- IMPORTS -------------------------------------------------------------------------------------
+
+#region ------- FIXTURES ------------------------------------------------------------------------------------
+
+class LogDatabase:
+    """Fresh SQLite file with the application tables, opened with sync or async sessions
+
+    Async sessions get an engine per event loop, as each test scenario runs its own.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.engine = create_engine(f"sqlite:///{path}")
+        Base.metadata.create_all(bind=self.engine)
+        self.session = sessionmaker(bind=self.engine)
+        self._async_engines = {}
+
+    def async_session(self):
+        loop = asyncio.get_running_loop()
+        if loop not in self._async_engines:
+            self._async_engines[loop] = create_async_engine(f"sqlite+aiosqlite:///{self.path}")
+        return async_sessionmaker(bind=self._async_engines[loop])()
+
+    def seed(self, records: list):
+        """Inserts log [records], as built by the capture middleware, registering their routes"""
+        with self.session() as session:
+            route_ids = RouteDictionary().get_ids(session, {record["route"] for record in records})
+            session.execute(insert(RequestLog), [encode_record(record, route_ids) for record in records])
+            session.commit()
+
+    def count_logs(self) -> int:
+        with self.engine.connect() as connection:
+            return connection.scalar(select(func.count()).select_from(RequestLog))
+
+@pytest.fixture
+def log_database(tmp_path) -> LogDatabase:
+    database = LogDatabase(tmp_path / "logs.db")
+    yield database
+    database.engine.dispose()
+
+#endregion ---- FIXTURES ------------------------------------------------------------------------------------
@@ -0,0 +1,56 @@
+#region ------- IMPORTS -------------------------------------------------------------------------------------
+
+import asyncio
+import csv
+import gzip
+import io
+import json
+from datetime import datetime, timedelta
+from src.log_export import export_stream
+from src.log_queries import LogFilters
+
+#endregion ---- IMPORTS -------------------------------------------------------------------------------------
+
+#region ------- UTILS ---------------------------------------------------------------------------------------
+
+def build_records() -> list:
+    return [
+        {
+            "type": "GET",
+            "route": "/users" if index % 2 else "/todos",
+            "ip_sender": "127.0.0.1",
+            "query": "",
+            "body": "",
+            "result_code": "200",
+            "timestamp": datetime(2024, 1, 1) + timedelta(seconds=index)
+        }
+        for index in range(25)
+    ]
+
+def collect(stream) -> list:
+    async def consume():
+        return [piece async for piece in stream]
+    return asyncio.run(consume())
+
+#endregion ---- UTILS ---------------------------------------------------------------------------------------
+
+#region ------- TESTS ---------------------------------------------------------------------------------------
+
+# Test the NDJSON export yields one piece per chunk and every log once, oldest first
+def test_ndjson_chunks(log_database):
+    log_database.seed(build_records())
+    pieces = collect(export_stream(log_database.async_session, LogFilters(), format="ndjson", chunk_size=10))
+    lines = b"".join(pieces).decode("utf-8").splitlines()
+    ids = [json.loads(line)["id"] for line in lines]
+    assert len(pieces) == 3, f"Error in chunking - Expected 3 pieces, got {len(pieces)}"
+    assert ids == list(range(1, 26)), f"Error in export order - Got {ids}"
+
+# Test the compressed CSV export decompresses to a header plus the filtered logs
+def test_gzip_csv(log_database):
+    log_database.seed(build_records())
+    stream = export_stream(log_database.async_session, LogFilters(route="/users"), format="csv", compress=True, chunk_size=4)
+    rows = list(csv.DictReader(io.StringIO(gzip.decompress(b"".join(collect(stream))).decode("utf-8"))))
+    assert len(rows) == 12, f"Error in filtered export - Expected 12 rows, got {len(rows)}"
+    assert all(row["route"] == "/users" for row in rows), "Error in filtered export - Unexpected route"
+
+#endregion ---- TESTS ---------------------------------------------------------------------------------------
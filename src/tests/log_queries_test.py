@@ -0,0 +1,72 @@
+#region ------- IMPORTS -------------------------------------------------------------------------------------
+
+from datetime import datetime, timedelta
+import pytest
+from src.log_queries import LogFilters, decode_cursor, encode_cursor, page_query
+from src.models import RequestLog
+from src.route_dictionary import RouteDictionary
+
+#endregion ---- IMPORTS -------------------------------------------------------------------------------------
+
+#region ------- CONSTANTS -----------------------------------------------------------------------------------
+
+START = datetime(2024, 1, 1, 12, 0, 0)
+
+#endregion ---- CONSTANTS -----------------------------------------------------------------------------------
+
+#region ------- UTILS ---------------------------------------------------------------------------------------
+
+@pytest.fixture
+def session(log_database):
+    # Pairs of logs share the same timestamp to exercise the id tie-breaker
+    log_database.seed([
+        {
+            "type": "GET",
+            "route": "/users" if index % 2 else "/todos",
+            "ip_sender": "127.0.0.1",
+            "query": "",
+            "body": "",
+            "result_code": 200 if index % 5 else 500,
+            "timestamp": START + timedelta(seconds=index // 2)
+        }
+        for index in range(25)
+    ])
+    with log_database.session() as session:
+        yield session
+
+def walk_pages(session, filters: LogFilters, limit: int) -> list:
+    ids, cursor = [], None
+    while True:
+        logs = session.scalars(page_query(filters, limit, cursor=cursor)).all()
+        ids.extend(log.id for log in logs)
+        if len(logs) < limit:
+            return ids
+        cursor = encode_cursor(logs[-1].timestamp, logs[-1].id)
+
+#endregion ---- UTILS ---------------------------------------------------------------------------------------
+
+#region ------- TESTS ---------------------------------------------------------------------------------------
+
+# Test walking all pages with cursors returns every log once, newest first
+def test_cursor_walk(session):
+    expected = [log.id for log in session.scalars(page_query(LogFilters(), 100)).all()]
+    assert len(expected) == 25, f"Error in page query - Expected 25 logs, got {len(expected)}"
+    assert walk_pages(session, LogFilters(), 4) == expected, "Error in keyset pagination - Pages do not match the full ordering"
+
+# Test filters combine with the cursor
+def test_filtered_walk(session):
+    filters = LogFilters(route="/users", result_code=200, since=START + timedelta(seconds=2))
+    ids = walk_pages(session, filters, 3)
+    logs = [session.get(RequestLog, log_id) for log_id in ids]
+    users_id = RouteDictionary().get_ids(session, ["/users"])["/users"]
+    assert logs, "Error in filters - Expected some matching logs"
+    assert all(log.route_id == users_id and log.result_code == 200 for log in logs), "Error in filters - Unexpected log returned"
+    assert all(log.timestamp >= START + timedelta(seconds=2) for log in logs), "Error in time range - Log older than since returned"
+
+# Test cursors round-trip and malformed ones are rejected
+def test_cursor_encoding():
+    assert decode_cursor(encode_cursor(START, 42)) == (START, 42), "Error in cursor encoding - Round trip mismatch"
+    with pytest.raises(ValueError):
+        decode_cursor("not-a-cursor")
+
+#endregion ---- TESTS ---------------------------------------------------------------------------------------
@@ -0,0 +1,123 @@
+#region ------- IMPORTS -------------------------------------------------------------------------------------
+
+import asyncio
+from datetime import datetime, timezone
+from sqlalchemy import select
+from src import rollups
+from src.log_writer import LogWriter
+from src.models import RequestLogRollup, RequestRoute
+from src.route_dictionary import RouteDictionary
+
+#endregion ---- IMPORTS -------------------------------------------------------------------------------------
+
+#region ------- UTILS ---------------------------------------------------------------------------------------
+
+def build_record(index: int) -> dict:
+    return {
+        "type": "GET",
+        "route": "/users",
+        "ip_sender": "127.0.0.1",
+        "query": f"offset={index}",
+        "body": "",
+        "result_code": 200,
+        "timestamp": datetime.now(timezone.utc)
+    }
+
+#endregion ---- UTILS ---------------------------------------------------------------------------------------
+
+#region ------- TESTS ---------------------------------------------------------------------------------------
+
+# Test every queued record is written in batches and drained on stop
+def test_batched_drain(log_database):
+    writer = LogWriter(log_database.async_session, RouteDictionary(), queue_size=5000, batch_size=100, flush_interval=10)
+
+    async def scenario():
+        await writer.start()
+        for index in range(1050):
+            await writer.submit(build_record(index))
+        await writer.stop()
+
+    asyncio.run(scenario())
+    assert log_database.count_logs() == 1050, f"Error in drain - Expected 1050 logs, got {log_database.count_logs()}"
+    assert writer.stats.batches >= 11, f"Error in batching - Expected at least 11 batches, got {writer.stats.batches}"
+
+# Test the drop policy discards records over the queue capacity instead of blocking
+def test_drop_policy(log_database):
+    writer = LogWriter(log_database.async_session, RouteDictionary(), queue_size=10, batch_size=100, flush_interval=10, overflow_policy="drop")
+
+    async def scenario():
+        await writer.start()
+        # Submitting never yields with this policy, so the writer cannot consume before the loop ends
+        for index in range(25):
+            await writer.submit(build_record(index))
+        await writer.stop()
+
+    asyncio.run(scenario())
+    assert writer.stats.dropped == 15, f"Error in drop policy - Expected 15 dropped, got {writer.stats.dropped}"
+    assert log_database.count_logs() == 10, f"Error in drop policy - Expected 10 logs, got {log_database.count_logs()}"
+
+# Test records are flushed when the loop they were queued on is torn down without a stop
+def test_flush_on_cancel(log_database):
+    writer = LogWriter(log_database.async_session, RouteDictionary(), queue_size=100, batch_size=100, flush_interval=10)
+
+    async def scenario():
+        for index in range(3):
+            await writer.submit(build_record(index))
+
+    asyncio.run(scenario())
+    assert log_database.count_logs() == 3, f"Error in cancel flush - Expected 3 logs, got {log_database.count_logs()}"
+
+# Test records not kept by the capture policy reach the batch hooks but are not inserted
+def test_not_stored_records(log_database):
+    hooked = []
+    writer = LogWriter(log_database.async_session, RouteDictionary(), queue_size=100, batch_size=100, flush_interval=10,
+                       batch_hooks=[lambda session, batch: hooked.extend(batch)])
+
+    async def scenario():
+        await writer.start()
+        for index in range(10):
+            await writer.submit({**build_record(index), "keep": index % 2 == 0})
+        await writer.stop()
+
+    asyncio.run(scenario())
+    assert log_database.count_logs() == 5, f"Error in capture - Expected 5 stored logs, got {log_database.count_logs()}"
+    assert len(hooked) == 10, f"Error in capture - Expected 10 records handed to the hooks, got {len(hooked)}"
+    assert writer.stats.not_stored == 5, f"Error in capture - Expected 5 records not stored, got {writer.stats.not_stored}"
+
+# Test a batch whose transaction fails once is written again rather than counted as failed
+def test_write_retry(log_database):
+    failures = [RuntimeError("deadlock detected")]
+    def failing_hook(session, batch):
+        if failures:
+            raise failures.pop()
+    writer = LogWriter(log_database.async_session, RouteDictionary(), queue_size=100, batch_size=100, flush_interval=10, batch_hooks=[failing_hook])
+
+    async def scenario():
+        await writer.start()
+        for index in range(5):
+            await writer.submit(build_record(index))
+        await writer.stop()
+
+    asyncio.run(scenario())
+    assert log_database.count_logs() == 5, f"Error in retry - Expected 5 logs, got {log_database.count_logs()}"
+    assert writer.stats.failed == 0, f"Error in retry - Expected no failed records, got {writer.stats.failed}"
+
+# Test unknown paths are stored, long ones cut, while the rollups are keyed on the route template
+def test_unmatched_paths(log_database):
+    writer = LogWriter(log_database.async_session, RouteDictionary(max_length=20), queue_size=100, batch_size=100,
+                       flush_interval=10, batch_hooks=[rollups.record_batch])
+
+    async def scenario():
+        await writer.start()
+        for path in ("/wp-login.php", "/cgi-bin/" + "x" * 100):
+            await writer.submit({**build_record(0), "route": path, "route_template": "<unmatched>", "result_code": 404})
+        await writer.stop()
+
+    asyncio.run(scenario())
+    with log_database.session() as session:
+        paths = sorted(session.scalars(select(RequestRoute.path)).all())
+        routes = session.scalars(select(RequestLogRollup.route)).all()
+    assert paths == ["/cgi-bin/xxxxxxxx...", "/wp-login.php"], f"Error in stored paths - Got {paths}"
+    assert routes == ["<unmatched>"], f"Error in rollup keys - Expected only <unmatched>, got {routes}"
+
+#endregion ---- TESTS ---------------------------------------------------------------------------------------
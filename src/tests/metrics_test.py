@@ -0,0 +1,69 @@
+#region ------- IMPORTS -------------------------------------------------------------------------------------
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+from src.metrics import POOL_CHECKOUT_WAIT, REGISTRY, REQUEST_LATENCY, Counter, Gauge, Histogram, MetricsMiddleware, Registry, instrument_engine
+
+#endregion ---- IMPORTS -------------------------------------------------------------------------------------
+
+#region ------- TESTS ---------------------------------------------------------------------------------------
+
+# Test histograms render cumulative buckets, sum and count in the Prometheus text format
+def test_histogram_render():
+    registry = Registry()
+    histogram = Histogram("latency_seconds", "Latency", ("route",), registry, buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 3.0):
+        histogram.observe(value, "/users")
+    lines = registry.render().splitlines()
+    assert "# TYPE latency_seconds histogram" in lines, "Error in render - Missing TYPE line"
+    assert 'latency_seconds_bucket{route="/users",le="0.1"} 1' in lines, "Error in render - Wrong first bucket"
+    assert 'latency_seconds_bucket{route="/users",le="1.0"} 3' in lines, "Error in render - Buckets are not cumulative"
+    assert 'latency_seconds_bucket{route="/users",le="+Inf"} 4' in lines, "Error in render - Wrong +Inf bucket"
+    assert 'latency_seconds_count{route="/users"} 4' in lines, "Error in render - Wrong count"
+
+# Test counters, explicit gauges and gauges read at scrape time
+def test_counter_and_gauges():
+    registry = Registry()
+    counter = Counter("calls", "Calls", ("status",), registry)
+    counter.inc("200")
+    counter.inc("200", amount=2)
+    Gauge("depth", "Depth", registry=registry, function=lambda: 7)
+    gauge = Gauge("label_escape", "Escaping", ("name",), registry)
+    gauge.set(1, 'a"b')
+    lines = registry.render().splitlines()
+    assert 'calls_total{status="200"} 3' in lines, f"Error in counter - Expected 3, got {counter.value('200')}"
+    assert "depth 7" in lines, "Error in callback gauge - Value not read at scrape"
+    assert 'label_escape{name="a\\"b"} 1' in lines, "Error in render - Label value not escaped"
+
+# Test requests are timed under the template of their route
+def test_middleware_route_label():
+    app = FastAPI()
+    app.add_middleware(MetricsMiddleware)
+
+    @app.get("/items/{item_id}")
+    async def get_item(item_id: int):
+        return {"id": item_id}
+
+    client = TestClient(app)
+    before = REQUEST_LATENCY.count("GET", "/items/{item_id}", 200)
+    client.get("/items/1")
+    client.get("/items/2")
+    after = REQUEST_LATENCY.count("GET", "/items/{item_id}", 200)
+    assert after - before == 2, f"Error in middleware - Expected 2 observations, got {after - before}"
+
+# Test pool checkouts are timed and pool usage is exposed
+def test_engine_instrumentation(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'pool.db'}")
+    instrument_engine(engine, "test")
+    before = POOL_CHECKOUT_WAIT.count("test")
+    with engine.connect() as connection:
+        connection.execute(text("SELECT 1"))
+        rendered = REGISTRY.render()
+    assert 'db_pool_connections{engine="test",state="checked_out"} 1' in rendered.splitlines(), "Error in pool usage - Expected 1 checked out"
+    engine.dispose()
+    with engine.connect() as connection:
+        connection.execute(text("SELECT 1"))
+    assert POOL_CHECKOUT_WAIT.count("test") - before == 2, "Error in checkout wait - Recreated pool not instrumented"
+
+#endregion ---- TESTS ---------------------------------------------------------------------------------------
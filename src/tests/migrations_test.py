@@ -0,0 +1,57 @@
+#region ------- IMPORTS -------------------------------------------------------------------------------------
+
+from sqlalchemy import create_engine, inspect, select, text
+from sqlalchemy.orm import Session
+from src.migrations import LEGACY_TABLE, copy_legacy_rows, upgrade
+from src.models import RequestLog, RequestRoute
+
+#endregion ---- IMPORTS -------------------------------------------------------------------------------------
+
+#region ------- CONSTANTS -----------------------------------------------------------------------------------
+
+# Layout of request_logs before the compact schema, every attribute stored as a string
+LEGACY_DDL = """
+CREATE TABLE request_logs (
+    id INTEGER PRIMARY KEY,
+    type VARCHAR NOT NULL,
+    route VARCHAR NOT NULL,
+    ip_sender VARCHAR NOT NULL,
+    query VARCHAR,
+    body VARCHAR,
+    result_code VARCHAR NOT NULL,
+    timestamp DATETIME NOT NULL
+)
+"""
+
+#endregion ---- CONSTANTS -----------------------------------------------------------------------------------
+
+#region ------- TESTS ---------------------------------------------------------------------------------------
+
+# Test a legacy table is swapped out at upgrade and its rows converted in batches
+def test_compact_conversion(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'logs.db'}")
+    with engine.begin() as connection:
+        connection.execute(text(LEGACY_DDL))
+        connection.execute(text("CREATE INDEX ix_request_logs_id ON request_logs (id)"))
+        for index in range(7):
+            connection.execute(text(
+                "INSERT INTO request_logs (type, route, ip_sender, query, body, result_code, timestamp) "
+                "VALUES (:type, :route, :ip, '', '', :code, '2024-01-01 12:00:00.000000')"
+            ), {"type": "get" if index % 2 else "BREW", "route": f"/route{index % 3}", "ip": "10.0.0.1" if index else "testclient", "code": "200"})
+
+    upgrade(engine)
+    assert inspect(engine).has_table(LEGACY_TABLE), "Error in swap - Legacy table not moved aside"
+
+    converted = copy_legacy_rows(engine, batch_size=3)
+    assert converted == 7, f"Error in conversion - Expected 7 rows, got {converted}"
+    assert not inspect(engine).has_table(LEGACY_TABLE), "Error in conversion - Legacy table not dropped"
+
+    with Session(engine) as session:
+        logs = session.scalars(select(RequestLog).order_by(RequestLog.id)).all()
+        paths = dict(session.execute(select(RequestRoute.id, RequestRoute.path)).all())
+    assert [log.type for log in logs[:2]] == ["OTHER", "GET"], f"Error in method encoding - Got {[log.type for log in logs[:2]]}"
+    assert logs[0].ip_sender is None and logs[1].ip_sender == "10.0.0.1", "Error in address encoding"
+    assert all(log.result_code == 200 for log in logs), "Error in status encoding"
+    assert sorted(set(paths.values())) == ["/route0", "/route1", "/route2"], f"Error in route dictionary - Got {paths}"
+
+#endregion ---- TESTS ---------------------------------------------------------------------------------------
@@ -0,0 +1,90 @@
+#region ------- IMPORTS -------------------------------------------------------------------------------------
+
+import asyncio
+import httpx
+import pytest
+from src.mirror import UpstreamMirror
+from src.upstream import UpstreamClient
+
+#endregion ---- IMPORTS -------------------------------------------------------------------------------------
+
+#region ------- UTILS ---------------------------------------------------------------------------------------
+
+class MockUpstream:
+    """Serves a small dataset with an ETag per version and answers 304 to matching conditional requests"""
+
+    def __init__(self):
+        self.version = 1
+        self.requests = []
+        self.failing = False
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append((request.url.path, request.headers.get("If-None-Match")))
+        if self.failing:
+            return httpx.Response(503)
+        etag = f'"v{self.version}"'
+        if request.headers.get("If-None-Match") == etag:
+            return httpx.Response(304, headers={"ETag": etag})
+        if request.url.path == "/users":
+            data = [{"id": 2}, {"id": 1}]
+        else:
+            data = [{"userId": 1, "id": 3}, {"userId": 2, "id": 2}, {"userId": 1, "id": 1}]
+            if self.version > 1:
+                data.append({"userId": 1, "id": 4})
+        return httpx.Response(200, json=data, headers={"ETag": etag})
+
+@pytest.fixture
+def upstream():
+    return MockUpstream()
+
+def build_mirror(upstream: MockUpstream, max_staleness: float = 60) -> UpstreamMirror:
+    client = UpstreamClient(base_url="http://upstream.test", transport=httpx.MockTransport(upstream.handler))
+    return UpstreamMirror(client, refresh_interval=60, max_staleness=max_staleness)
+
+#endregion ---- UTILS ---------------------------------------------------------------------------------------
+
+#region ------- TESTS ---------------------------------------------------------------------------------------
+
+# Test the snapshot indexes users by id and groups todos by userId, sorted by id
+def test_indexes(upstream):
+    mirror = build_mirror(upstream)
+    asyncio.run(mirror.refresh())
+    snapshot = mirror.fresh_snapshot()
+    assert [user["id"] for user in snapshot.users] == [1, 2], "Error in users index - Users not sorted by id"
+    assert [todo["id"] for todo in snapshot.todos_by_user[1]] == [1, 3], "Error in todos index - Todos not grouped or sorted"
+    assert snapshot.users_by_id[2] == {"id": 2}, f"Error in users index - Expected user 2, got {snapshot.users_by_id[2]}"
+
+# Test unchanged data is revalidated with conditional requests and keeps the snapshot version
+def test_conditional_refresh(upstream):
+    mirror = build_mirror(upstream)
+
+    async def scenario():
+        await mirror.refresh()
+        first = mirror.snapshot
+        await mirror.refresh()
+        unchanged = mirror.snapshot
+        upstream.version = 2
+        await mirror.refresh()
+        return first, unchanged, mirror.snapshot
+
+    first, unchanged, changed = asyncio.run(scenario())
+    assert upstream.requests[2][1] == '"v1"', f"Error in conditional request - Expected If-None-Match, got {upstream.requests[2][1]}"
+    assert unchanged.version == first.version, f"Error in 304 handling - Expected version {first.version}, got {unchanged.version}"
+    assert unchanged.todos_by_user is first.todos_by_user, "Error in 304 handling - Indexes should be reused"
+    assert changed.version == first.version + 1, f"Error in refresh - Expected version {first.version + 1}, got {changed.version}"
+    assert len(changed.todos_by_user[1]) == 3, f"Error in refresh - Expected 3 todos, got {len(changed.todos_by_user[1])}"
+
+# Test a failed refresh keeps the previous snapshot and a too old snapshot is no longer served
+def test_failure_and_staleness(upstream):
+    mirror = build_mirror(upstream, max_staleness=0)
+    asyncio.run(mirror.refresh())
+    snapshot = mirror.snapshot
+    upstream.failing = True
+    with pytest.raises(Exception):
+        asyncio.run(mirror.refresh())
+    status = mirror.status()
+    assert mirror.snapshot is snapshot, "Error in failed refresh - Previous snapshot should be kept"
+    assert status["consecutive_failures"] == 1, f"Error in status - Expected 1 failure, got {status['consecutive_failures']}"
+    assert mirror.fresh_snapshot() is None, "Error in staleness - Stale snapshot should not be served"
+
+#endregion ---- TESTS ---------------------------------------------------------------------------------------
@@ -0,0 +1,86 @@
+#region ------- IMPORTS -------------------------------------------------------------------------------------
+
+import gzip
+import json
+import os
+from datetime import date, datetime, timedelta
+from sqlalchemy import inspect, text
+from src import partitions
+from src.partitions import archive_partition, expire_partitions, parse_partition_name, partition_name, period_start
+
+#endregion ---- IMPORTS -------------------------------------------------------------------------------------
+
+#region ------- UTILS ---------------------------------------------------------------------------------------
+
+def build_partition(log_database, start: date, size: int) -> str:
+    """Seeds [size] logs and copies them to a table named as the partition starting on [start]"""
+    log_database.seed([
+        {
+            "type": "GET",
+            "route": "/users",
+            "ip_sender": "127.0.0.1",
+            "query": f"offset={index}",
+            "body": "",
+            "result_code": 200,
+            "timestamp": datetime.combine(start, datetime.min.time()) + timedelta(minutes=index)
+        }
+        for index in range(size)
+    ])
+    name = partition_name(start)
+    with log_database.engine.begin() as connection:
+        connection.execute(text(f"CREATE TABLE {name} AS SELECT * FROM request_logs"))
+    return name
+
+def read_archive(path: str) -> list:
+    with gzip.open(path, "rt", encoding="utf-8") as file:
+        return [json.loads(line) for line in file]
+
+#endregion ---- IMPORTS -------------------------------------------------------------------------------------
+
+#region ------- TESTS ---------------------------------------------------------------------------------------
+
+# Test periods start on the day itself (daily) or on the previous Monday (weekly)
+def test_period_start():
+    sunday = date(2024, 1, 7)
+    assert period_start(sunday, "daily") == sunday, "Error in daily period - Expected the day itself"
+    assert period_start(sunday, "weekly") == date(2024, 1, 1), f"Error in weekly period - Got {period_start(sunday, 'weekly')}"
+
+# Test partition names round-trip and foreign tables are ignored
+def test_partition_names():
+    assert partition_name(date(2024, 1, 1)) == "request_logs_p20240101", "Error in partition naming"
+    assert parse_partition_name("request_logs_p20240101") == date(2024, 1, 1), "Error in partition name parsing"
+    assert parse_partition_name("request_logs_default") is None, "Error in partition name parsing - Default partition matched"
+
+# Test a partition is archived as NDJSON with its route paths, oldest first, and no temporary file left
+def test_archive_partition(log_database, tmp_path):
+    name = build_partition(log_database, date(2024, 1, 1), 25)
+    with log_database.engine.connect() as connection:
+        path = archive_partition(connection, name, str(tmp_path / "archive"), chunk_size=10)
+    rows = read_archive(path)
+    assert len(rows) == 25, f"Error in archive - Expected 25 rows, got {len(rows)}"
+    assert all(row["route"] == "/users" for row in rows), "Error in archive - Route path not resolved"
+    assert [row["query"] for row in rows[:2]] == ["offset=0", "offset=1"], f"Error in archive order - Got {rows[:2]}"
+    assert os.listdir(tmp_path / "archive") == [f"{name}.ndjson.gz"], "Error in archive - Unexpected files left"
+
+# Test expired partitions are dropped only once archived, and kept for the next pass when the archive fails
+def test_expire_partitions(log_database, tmp_path, monkeypatch):
+    expired, recent = build_partition(log_database, date(2024, 1, 1), 3), partition_name(date(2024, 3, 1))
+    monkeypatch.setattr(partitions, "list_partitions", lambda connection: [expired, recent])
+    # SQLite has no partitions to detach, only the drop is run
+    monkeypatch.setattr(partitions, "drop_partition", lambda connection, name: connection.execute(text(f"DROP TABLE {name}")))
+    archive_dir = str(tmp_path / "archive")
+
+    def failing_archive(connection, name, archive_dir):
+        raise OSError("disk full")
+    with monkeypatch.context() as failing:
+        failing.setattr(partitions, "archive_partition", failing_archive)
+        result = expire_partitions(log_database.engine, date(2024, 3, 1), "daily", 30, archive_dir)
+    assert result == [], f"Error in expiry - Expected nothing expired on a failed archive, got {result}"
+    assert expired in inspect(log_database.engine).get_table_names(), "Error in expiry - Partition dropped without archive"
+
+    result = expire_partitions(log_database.engine, date(2024, 3, 1), "daily", 30, archive_dir)
+    assert result == [expired], f"Error in expiry - Expected [{expired}], got {result}"
+    assert expired not in inspect(log_database.engine).get_table_names(), "Error in expiry - Archived partition not dropped"
+    assert len(read_archive(os.path.join(archive_dir, f"{expired}.ndjson.gz"))) == 3, "Error in expiry - Archive incomplete"
+
+#endregion ---- TESTS ---------------------------------------------------------------------------------------
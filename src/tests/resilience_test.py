@@ -0,0 +1,124 @@
+#region ------- IMPORTS -------------------------------------------------------------------------------------
+
+import asyncio
+import pytest
+from src import metrics
+from src.resilience import CallPolicy, CircuitOpenError, DeadlineExceeded, ResilientCaller, RetryBudget
+from src.upstream import UpstreamError
+
+#endregion ---- IMPORTS -------------------------------------------------------------------------------------
+
+#region ------- UTILS ---------------------------------------------------------------------------------------
+
+class FlakyFetch:
+    """Fails with the given statuses in turn (None for a transport error), then answers, after [delays] seconds"""
+
+    def __init__(self, failures: list = (), delays: list = ()):
+        self.failures = list(failures)
+        self.delays = list(delays)
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        if self.delays:
+            await asyncio.sleep(self.delays.pop(0))
+        if self.failures:
+            raise UpstreamError("failed", self.failures.pop(0))
+        return self.calls
+
+def build_caller(**settings) -> ResilientCaller:
+    return ResilientCaller("test", CallPolicy(**{"backoff": 0, "breaker_failures": 3, "breaker_reset": 60, **settings}))
+
+#endregion ---- UTILS ---------------------------------------------------------------------------------------
+
+#region ------- TESTS ---------------------------------------------------------------------------------------
+
+# Test transport errors and 5xx are retried while client errors are not
+def test_retries():
+    caller, fetch = build_caller(), FlakyFetch([None, 503])
+    assert asyncio.run(caller.call(fetch)) == 3, f"Error in retries - Expected success on the 3rd attempt, got {fetch.calls} calls"
+
+    caller, fetch = build_caller(), FlakyFetch([404])
+    with pytest.raises(UpstreamError):
+        asyncio.run(caller.call(fetch))
+    assert fetch.calls == 1, f"Error in retries - Expected a 404 not to be retried, got {fetch.calls} calls"
+    assert caller.breaker.state == "closed", "Error in retries - A client error should not count as an upstream failure"
+
+# Test retries stop once the budget is spent
+def test_retry_budget():
+    budget = RetryBudget(ratio=0.5, min_per_second=0, max_tokens=1)
+    assert budget.try_spend(), "Error in retry budget - Expected the initial token to be spendable"
+    assert not budget.try_spend(), "Error in retry budget - Expected the budget to be exhausted"
+    budget.deposit()
+    budget.deposit()
+    assert budget.try_spend(), "Error in retry budget - Expected two deposits of 0.5 to allow a retry"
+
+    caller, fetch = build_caller(max_attempts=5, breaker_failures=10), FlakyFetch([503] * 5)
+    caller.budget = RetryBudget(ratio=0, min_per_second=0, max_tokens=1)
+    with pytest.raises(UpstreamError):
+        asyncio.run(caller.call(fetch))
+    assert fetch.calls == 2, f"Error in retry budget - Expected a single retry, got {fetch.calls} calls"
+
+# Test the breaker opens after consecutive failures, rejects calls, then closes after a successful probe
+def test_circuit_breaker():
+    caller, fetch = build_caller(max_attempts=1), FlakyFetch([503] * 3)
+    for _ in range(3):
+        with pytest.raises(UpstreamError):
+            asyncio.run(caller.call(fetch))
+    assert caller.breaker.state == "open", f"Error in breaker - Expected open, got {caller.breaker.state}"
+    states = {labels: value for _, labels, _, value in metrics.UPSTREAM_BREAKER_STATE.samples()}
+    assert states[("test",)] == 2, f"Error in breaker - Expected the state gauge at 2, got {states[('test',)]}"
+
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(caller.call(fetch))
+    assert fetch.calls == 3, f"Error in breaker - Expected no call while open, got {fetch.calls} calls"
+
+    caller.breaker.opened_at -= 60
+    assert asyncio.run(caller.call(fetch)) == 4, "Error in breaker - Expected the probe call to go through"
+    assert caller.breaker.state == "closed", f"Error in breaker - Expected closed after the probe, got {caller.breaker.state}"
+
+# Test the deadline bounds the call, retries and backoff included
+def test_deadline():
+    caller, fetch = build_caller(deadline=0.05), FlakyFetch(delays=[1])
+    with pytest.raises(DeadlineExceeded) as error:
+        asyncio.run(caller.call(fetch))
+    assert error.value.status_code == 504, f"Error in deadline - Expected status 504, got {error.value.status_code}"
+
+# Test a slow call is hedged and the fastest copy answers
+def test_hedging():
+    caller, fetch = build_caller(hedge=True, hedge_min_delay=0.01), FlakyFetch(delays=[1, 0])
+    before = metrics.UPSTREAM_HEDGES.value("test", "won")
+    assert asyncio.run(caller.call(fetch)) == 2, "Error in hedging - Expected the answer of the hedged copy"
+    assert fetch.calls == 2, f"Error in hedging - Expected 2 calls, got {fetch.calls}"
+    assert metrics.UPSTREAM_HEDGES.value("test", "won") == before + 1, "Error in hedging - Hedge not counted"
+
+# Test no copy of a hedged call keeps running once the deadline is exceeded
+def test_hedging_deadline():
+    cancelled = []
+    async def hanging_fetch():
+        try:
+            await asyncio.sleep(1)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    async def scenario(hedge_min_delay: float):
+        caller = build_caller(deadline=0.05, hedge=True, hedge_min_delay=hedge_min_delay)
+        with pytest.raises(DeadlineExceeded):
+            await caller.call(hanging_fetch)
+        await asyncio.sleep(0)
+        return len(cancelled)
+
+    assert asyncio.run(scenario(1)) == 1, f"Error in hedging - Expected the primary cancelled, got {len(cancelled)} cancelled"
+    cancelled.clear()
+    assert asyncio.run(scenario(0.01)) == 2, f"Error in hedging - Expected both copies cancelled, got {len(cancelled)} cancelled"
+
+# Test settings are overridden per endpoint from the environment
+def test_policy_from_config(monkeypatch):
+    monkeypatch.setenv("UPSTREAM_TODOS_DEADLINE", "0.5")
+    monkeypatch.setenv("UPSTREAM_TODOS_HEDGE", "true")
+    todos, users = CallPolicy.from_config("todos"), CallPolicy.from_config("users")
+    assert todos.deadline == 0.5 and todos.hedge, f"Error in policy - Expected the todos overrides, got {todos}"
+    assert users.deadline != 0.5, f"Error in policy - Expected the users defaults, got {users}"
+
+#endregion ---- TESTS ---------------------------------------------------------------------------------------
@@ -0,0 +1,78 @@
+#region ------- IMPORTS -------------------------------------------------------------------------------------
+
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+from src.responses import PageCache, choose_encoding
+
+#endregion ---- IMPORTS -------------------------------------------------------------------------------------
+
+#region ------- UTILS ---------------------------------------------------------------------------------------
+
+DATA = [{"id": index, "title": "x" * 50} for index in range(100)]
+
+def build_client(cache: PageCache) -> TestClient:
+    app = FastAPI()
+
+    @app.get("/items")
+    async def get_items(request: Request, limit: int = 5):
+        return cache.respond(request, ("items", limit), DATA, lambda: DATA[:limit])
+
+    @app.get("/items/once")
+    async def get_items_once(request: Request, limit: int = 5):
+        return cache.render(request, DATA[:limit])
+
+    return TestClient(app)
+
+#endregion ---- UTILS ---------------------------------------------------------------------------------------
+
+#region ------- TESTS ---------------------------------------------------------------------------------------
+
+# Test a page is served with a strong ETag and a matching If-None-Match gets a 304
+def test_etag_revalidation():
+    client = build_client(PageCache(max_entries=10, min_compress_bytes=1024))
+    response = client.get("/items", headers={"Accept-Encoding": "identity"})
+    etag = response.headers["ETag"]
+    assert response.json() == DATA[:5], "Error in serialization - Page content mismatch"
+    assert not etag.startswith("W/"), f"Error in ETag - Expected a strong ETag, got {etag}"
+
+    revalidated = client.get("/items", headers={"Accept-Encoding": "identity", "If-None-Match": etag})
+    assert revalidated.status_code == 304, f"Error in revalidation - Expected 304, got {revalidated.status_code}"
+    assert revalidated.content == b"", "Error in revalidation - 304 must not have a body"
+
+# Test large pages are compressed with the negotiated encoding and small ones are not
+def test_compression():
+    client = build_client(PageCache(max_entries=10, min_compress_bytes=1024))
+    large = client.get("/items?limit=50", headers={"Accept-Encoding": "gzip"})
+    small = client.get("/items?limit=1", headers={"Accept-Encoding": "gzip"})
+    assert large.headers.get("Content-Encoding") == "gzip", f"Error in negotiation - Expected gzip, got {large.headers.get('Content-Encoding')}"
+    assert large.json() == DATA[:50], "Error in compression - Decoded page mismatch"
+    assert "Content-Encoding" not in small.headers, "Error in compression - Small page should not be compressed"
+
+# Test pages are rebuilt when the data they come from is replaced and evicted over capacity
+def test_source_identity():
+    cache = PageCache(max_entries=2, min_compress_bytes=1024)
+    first = cache.get("a", DATA, lambda: DATA[:1])
+    assert cache.get("a", DATA, lambda: DATA[:2]) is first, "Error in page cache - Page should be reused"
+    replaced = list(DATA)
+    assert cache.get("a", replaced, lambda: replaced[:2]).etag != first.etag, "Error in page cache - Stale page served"
+    cache.get("b", DATA, lambda: DATA[:1])
+    cache.get("c", DATA, lambda: DATA[:1])
+    assert len(cache) == 2, f"Error in eviction - Expected 2 pages, got {len(cache)}"
+
+# Test pages rendered for a single request are revalidated and compressed but not cached
+def test_render():
+    cache = PageCache(max_entries=10, min_compress_bytes=1024)
+    client = build_client(cache)
+    response = client.get("/items/once?limit=50", headers={"Accept-Encoding": "gzip"})
+    assert response.headers.get("Content-Encoding") == "gzip", f"Error in negotiation - Expected gzip, got {response.headers.get('Content-Encoding')}"
+    revalidated = client.get("/items/once?limit=50", headers={"Accept-Encoding": "gzip", "If-None-Match": response.headers["ETag"]})
+    assert revalidated.status_code == 304, f"Error in revalidation - Expected 304, got {revalidated.status_code}"
+    assert len(cache) == 0, f"Error in page cache - Expected no cached page, got {len(cache)}"
+
+# Test Accept-Encoding negotiation honours q-values
+def test_choose_encoding():
+    assert choose_encoding("gzip;q=0.5, identity") == "gzip", "Error in negotiation - Expected gzip"
+    assert choose_encoding("gzip;q=0") == "identity", "Error in negotiation - gzip refused by the client"
+    assert choose_encoding("") == "identity", "Error in negotiation - Expected identity without header"
+
+#endregion ---- TESTS ---------------------------------------------------------------------------------------
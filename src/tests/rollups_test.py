@@ -0,0 +1,98 @@
+#region ------- IMPORTS -------------------------------------------------------------------------------------
+
+from datetime import datetime, timedelta
+from fastapi import FastAPI
+from sqlalchemy import insert
+from src import rollups
+from src.log_writer import encode_record
+from src.models import RequestLog
+from src.route_dictionary import RouteDictionary
+
+#endregion ---- IMPORTS -------------------------------------------------------------------------------------
+
+#region ------- CONSTANTS -----------------------------------------------------------------------------------
+
+START = datetime(2024, 1, 1, 12, 0, 0)
+
+#endregion ---- CONSTANTS -----------------------------------------------------------------------------------
+
+#region ------- UTILS ---------------------------------------------------------------------------------------
+
+def build_records() -> list:
+    return [
+        {
+            "type": "GET",
+            "route": "/users",
+            "ip_sender": "127.0.0.1",
+            "query": "",
+            "body": "",
+            "result_code": "500" if index % 4 == 0 else "200",
+            "timestamp": START + timedelta(seconds=index * 10),
+            "duration_ms": float(index)
+        }
+        for index in range(12)
+    ]
+
+def read_stats(session_factory) -> list:
+    with session_factory() as session:
+        rows = session.scalars(rollups.stats_query(START, START + timedelta(hours=1))).all()
+        return [rollups.serialize_rollup(row) for row in rows]
+
+#endregion ---- UTILS ---------------------------------------------------------------------------------------
+
+#region ------- TESTS ---------------------------------------------------------------------------------------
+
+# Test batches written incrementally and a full backfill produce the same rollups
+def test_incremental_matches_backfill(log_database):
+    session_factory = log_database.session
+    records = build_records()
+
+    # Write the logs in two batches, as the log writer would
+    for batch in (records[:5], records[5:]):
+        with session_factory() as session:
+            route_ids = RouteDictionary().get_ids(session, {record["route"] for record in batch})
+            session.execute(insert(RequestLog), [encode_record(record, route_ids) for record in batch])
+            rollups.record_batch(session, batch)
+            session.commit()
+    incremental = read_stats(session_factory)
+
+    processed = rollups.backfill(session_factory, until=START + timedelta(hours=1))
+    rebuilt = read_stats(session_factory)
+
+    assert processed == 12, f"Error in backfill - Expected 12 logs read, got {processed}"
+    assert incremental == rebuilt, "Error in rollups - Incremental and backfilled aggregates differ"
+    assert [(row["status"], row["count"]) for row in rebuilt] == [("200", 4), ("500", 2), ("200", 5), ("500", 1)], f"Error in bucketing - Got {rebuilt}"
+    assert sum(row["error_count"] for row in rebuilt) == 3, "Error in error counting - Expected 3 errors"
+
+# Test a backfill counts the logs not stored by the capture policy through the weight of the sampled ones
+def test_weighted_backfill(log_database):
+    records = build_records()
+    # Errors are always stored, two successes per interval are sampled and stand for all of them
+    weights = {1: 4 / 3, 2: 8 / 3, 6: 5 / 2, 7: 5 / 2}
+    log_database.seed([
+        {**record, "sample_weight": weights.get(index)} for index, record in enumerate(records)
+        if index in weights or record["result_code"] == "500"
+    ])
+
+    # Chunks of a single log: fractional weights of an interval must be summed before being rounded
+    processed = rollups.backfill(log_database.session, until=START + timedelta(hours=1), chunk_size=1)
+    rebuilt = read_stats(log_database.session)
+
+    assert processed == 7, f"Error in backfill - Expected 7 logs read, got {processed}"
+    assert [(row["status"], row["count"]) for row in rebuilt] == [("200", 4), ("500", 2), ("200", 5), ("500", 1)], f"Error in weighting - Got {rebuilt}"
+
+# Test raw paths are matched to route templates when backfilling, unknown ones being collapsed
+def test_route_matcher(log_database):
+    app = FastAPI()
+    app.get("/users")(lambda: [])
+    app.get("/users/{user_id}")(lambda user_id: {})
+    match = rollups.route_matcher(app.routes)
+    assert match("/users/42") == "/users/{user_id}", f"Error in matching - Got {match('/users/42')}"
+    assert match("/wp-login.php") == "<unmatched>", f"Error in matching - Got {match('/wp-login.php')}"
+
+    log_database.seed([{**record, "route": path} for record, path in zip(build_records(), ["/users/1", "/users/2", "/.env"])])
+    rollups.backfill(log_database.session, until=START + timedelta(hours=1), route_template=match)
+    routes = sorted({row["route"] for row in read_stats(log_database.session)})
+    assert routes == ["/users/{user_id}", "<unmatched>"], f"Error in backfill - Got {routes}"
+
+#endregion ---- TESTS ---------------------------------------------------------------------------------------
@@ -109,4 +109,30 @@ def test_invalid_request():
     assert response.status_code == 422, f"Error in catching invalid values - Expected 422, got {response.status_code}"
     assert response.json()['detail'] == VALIDATION_ERROR_DESCR, f"Error in setting result description - Expected [{VALIDATION_ERROR_DESCR}], got [{response.json()['detail']}]"
 
+# Test GET /todos/batch endpoint groups the todos of each user, filtered and projected
+def test_batch_request():
+    response = client.get("/todos/batch?userIds=2&userIds=1&userIds=2&completed=false&fields=id,completed")
+    assert response.status_code == 200, f"Error in fetching data - Expected 200, got {response.status_code}"
+    assert [group['userId'] for group in response.json()] == [2, 1], f"Error in grouping - Expected users [2, 1], got {[group['userId'] for group in response.json()]}"
+    first = response.json()[1]['todos'][0]
+    assert first == {'id': 1, 'completed': False}, f"Error in projection - Expected {{'id': 1, 'completed': False}}, got {first}"
+    assert all(not todo['completed'] for group in response.json() for todo in group['todos']), "Error in completed filter - Got a completed todo"
+
+# Test GET /todos/batch endpoint with invalid query parameters
+def test_invalid_batch_request():
+    # Unknown field
+    response = client.get("/todos/batch?userIds=1&fields=id,owner")
+    assert response.status_code == 422, f"Error in catching invalid fields - Expected 422, got {response.status_code}"
+    # Empty projection
+    for fields in ("", ",,"):
+        response = client.get(f"/todos/batch?userIds=1&fields={fields}")
+        assert response.status_code == 422, f"Error in catching empty fields [{fields}] - Expected 422, got {response.status_code}"
+    # Too many users
+    response = client.get("/todos/batch?" + "&".join(f"userIds={user_id}" for user_id in range(1000)))
+    assert response.status_code == 422, f"Error in catching too many users - Expected 422, got {response.status_code}"
+    # Zero limit
+    response = client.get("/todos/batch?userIds=1&limit=0")
+    assert response.status_code == 422, f"Error in catching invalid values - Expected 422, got {response.status_code}"
+    assert response.json()['detail'] == VALIDATION_ERROR_DESCR, f"Error in setting result description - Expected [{VALIDATION_ERROR_DESCR}], got [{response.json()['detail']}]"
+
 #endregion ---- TESTS ---------------------------------------------------------------------------------------
\ No newline at end of file
@@ -0,0 +1,77 @@
+#region ------- IMPORTS -------------------------------------------------------------------------------------
+
+import asyncio
+import httpx
+import pytest
+from src.upstream import UpstreamClient, UpstreamError
+
+#endregion ---- IMPORTS -------------------------------------------------------------------------------------
+
+#region ------- UTILS ---------------------------------------------------------------------------------------
+
+def mock_handler(request: httpx.Request) -> httpx.Response:
+    if request.url.path == "/users":
+        return httpx.Response(200, json=[{"id": 1}, {"id": 2}])
+    if request.url.path == "/todos":
+        return httpx.Response(200, json=[{"userId": int(request.url.params["userId"]), "id": 1}])
+    if request.url.path == "/garbled":
+        return httpx.Response(200, content=b"<html>maintenance</html>")
+    return httpx.Response(503)
+
+def build_client() -> UpstreamClient:
+    return UpstreamClient(base_url="http://upstream.test", transport=httpx.MockTransport(mock_handler))
+
+#endregion ---- UTILS ---------------------------------------------------------------------------------------
+
+#region ------- TESTS ---------------------------------------------------------------------------------------
+
+# Test the client decodes JSON and forwards query parameters
+def test_get_json():
+    async def scenario():
+        client = build_client()
+        await client.start()
+        try:
+            users = await client.get_json("/users")
+            todos = await client.get_json("/todos", params={"userId": 3})
+        finally:
+            await client.close()
+        return users, todos
+
+    users, todos = asyncio.run(scenario())
+    assert len(users) == 2, f"Error in decoding users - Expected 2 results, got {len(users)}"
+    assert todos[0]["userId"] == 3, f"Error in forwarding params - Expected userId 3, got {todos[0]['userId']}"
+
+# Test a non-200 upstream answer is surfaced as UpstreamError with its status code
+def test_bad_status():
+    async def scenario():
+        client = build_client()
+        try:
+            await client.get_json("/missing")
+        finally:
+            await client.close()
+
+    with pytest.raises(UpstreamError) as exc_info:
+        asyncio.run(scenario())
+    assert exc_info.value.status_code == 503, f"Error in status propagation - Expected 503, got {exc_info.value.status_code}"
+
+# Test a 200 with a body that is not JSON is surfaced as UpstreamError, so the call policy handles it
+def test_invalid_json():
+    async def scenario():
+        client = build_client()
+        try:
+            await client.get_json("/garbled")
+        finally:
+            await client.close()
+
+    with pytest.raises(UpstreamError) as exc_info:
+        asyncio.run(scenario())
+    assert exc_info.value.status_code == 502, f"Error in decoding - Expected 502, got {exc_info.value.status_code}"
+
+# Test the pool is reopened when used from a different event loop without an explicit start
+def test_lazy_start_across_loops():
+    client = build_client()
+    for _ in range(2):
+        users = asyncio.run(client.get_json("/users"))
+        assert len(users) == 2, f"Error in lazy start - Expected 2 results, got {len(users)}"
+
+#endregion ---- TESTS ---------------------------------------------------------------------------------------
@@ -0,0 +1,107 @@
+#region ------- IMPORTS -------------------------------------------------------------------------------------
+
+import asyncio
+import time
+import httpx
+from src import config, metrics
+
+#endregion ---- IMPORTS -------------------------------------------------------------------------------------
+
+#region ------- EXCEPTIONS ----------------------------------------------------------------------------------
+
+class UpstreamError(Exception):
+    """Raised when the mock API cannot be reached or answers with a non-200 status"""
+
+    def __init__(self, message: str, status_code: int = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+#endregion ---- EXCEPTIONS ----------------------------------------------------------------------------------
+
+#region ------- UTILS ---------------------------------------------------------------------------------------
+
+def decode_json(response: httpx.Response):
+    """Returns the decoded JSON body of [response], raising UpstreamError (as a 502) when it is not valid JSON"""
+    try:
+        return response.json()
+    except ValueError as exc:
+        raise UpstreamError(f"Invalid JSON body from {response.request.url}: {exc}", 502) from exc
+
+#endregion ---- UTILS ---------------------------------------------------------------------------------------
+
+#region ------- CLIENT --------------------------------------------------------------------------------------
+
+class UpstreamClient:
+    """Async client for the mock API backed by a shared keep-alive connection pool
+
+    The pool is opened by the application lifespan through [start] and released by [close]. When the
+    lifespan has not run (e.g. a TestClient used without a context manager) the pool is opened lazily
+    on first use, and reopened if the event loop it was bound to is no longer the running one.
+    """
+
+    def __init__(self, base_url: str = None, transport: httpx.AsyncBaseTransport = None):
+        self.base_url = base_url or config.UPSTREAM_BASE_URL
+        self._transport = transport
+        self._client = None
+        self._loop = None
+
+    def _build_client(self) -> httpx.AsyncClient:
+        timeout = httpx.Timeout(
+            connect=config.UPSTREAM_CONNECT_TIMEOUT,
+            read=config.UPSTREAM_READ_TIMEOUT,
+            write=config.UPSTREAM_WRITE_TIMEOUT,
+            pool=config.UPSTREAM_POOL_TIMEOUT
+        )
+        limits = httpx.Limits(
+            max_connections=config.UPSTREAM_MAX_CONNECTIONS,
+            max_keepalive_connections=config.UPSTREAM_MAX_KEEPALIVE,
+            keepalive_expiry=config.UPSTREAM_KEEPALIVE_EXPIRY
+        )
+        return httpx.AsyncClient(
+            base_url=self.base_url,
+            timeout=timeout,
+            limits=limits,
+            http2=config.UPSTREAM_HTTP2 and self._transport is None,
+            transport=self._transport
+        )
+
+    async def start(self):
+        """Opens the connection pool on the running event loop"""
+        if self._client is not None and self._loop is asyncio.get_running_loop():
+            return
+        await self.close()
+        self._client = self._build_client()
+        self._loop = asyncio.get_running_loop()
+
+    async def close(self):
+        """Closes the connection pool, waiting for in-flight connections to be released"""
+        client, loop = self._client, self._loop
+        self._client, self._loop = None, None
+        if client is None or loop is not asyncio.get_running_loop():
+            # Connections bound to another (finished) event loop cannot be closed from here, drop them
+            return
+        await client.aclose()
+
+    async def get(self, path: str, params: dict = None, headers: dict = None) -> httpx.Response:
+        """Performs a GET on [path] and returns the raw response, raising UpstreamError on transport errors"""
+        if self._client is None or self._loop is not asyncio.get_running_loop():
+            await self.start()
+        started = time.perf_counter()
+        try:
+            response = await self._client.get(path, params=params, headers=headers)
+        except httpx.HTTPError as exc:
+            metrics.UPSTREAM_RESPONSES.inc(path, "error")
+            raise UpstreamError(f"Could not reach {self.base_url}{path}: {exc!r}") from exc
+        finally:
+            metrics.UPSTREAM_LATENCY.observe(time.perf_counter() - started, path)
+        metrics.UPSTREAM_RESPONSES.inc(path, response.status_code)
+        return response
+
+    async def get_json(self, path: str, params: dict = None):
+        """Performs a GET on [path] and returns the decoded JSON body, raising UpstreamError unless status is 200"""
+        response = await self.get(path, params=params)
+        if response.status_code != 200:
+            raise UpstreamError(f"Unexpected status {response.status_code} from {self.base_url}{path}", response.status_code)
+        return decode_json(response)
+
+#endregion ---- CLIENT --------------------------------------------------------------------------------------
@@ -0,0 +1,127 @@
+#region ------- IMPORTS -------------------------------------------------------------------------------------
+
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+from fastapi import FastAPI, Request, Response
+
+#endregion ---- IMPORTS -------------------------------------------------------------------------------------
+
+#region ------- CONSTANTS -----------------------------------------------------------------------------------
+
+# Same shape and size as the jsonplaceholder dataset: 10 users with 20 todos each
+USER_COUNT = 10
+TODOS_PER_USER = 20
+
+#endregion ---- CONSTANTS -----------------------------------------------------------------------------------
+
+#region ------- DATASET -------------------------------------------------------------------------------------
+
+def build_users() -> list:
+    return [
+        {
+            "id": user_id,
+            "name": f"User {user_id}",
+            "username": f"user{user_id}",
+            "email": f"user{user_id}@example.com",
+            "address": {"street": f"{user_id} Main Street", "suite": f"Apt. {user_id}", "city": "Springfield",
+                        "zipcode": f"{10000 + user_id}", "geo": {"lat": f"{user_id}.0", "lng": f"-{user_id}.0"}},
+            "phone": f"555-010{user_id}",
+            "website": f"user{user_id}.example.com",
+            "company": {"name": f"Company {user_id}", "catchPhrase": "Stubbed", "bs": "benchmarks"}
+        }
+        for user_id in range(1, USER_COUNT + 1)
+    ]
+
+def build_todos() -> list:
+    return [
+        {
+            "userId": (index // TODOS_PER_USER) + 1,
+            "id": index + 1,
+            "title": f"todo number {index + 1}",
+            "completed": index % 3 == 0
+        }
+        for index in range(USER_COUNT * TODOS_PER_USER)
+    ]
+
+#endregion ---- DATASET -------------------------------------------------------------------------------------
+
+#region ------- APP -----------------------------------------------------------------------------------------
+
+def create_stub_app(latency_ms: float = 0, jitter_ms: float = 0, error_rate: float = 0, seed: int = None) -> FastAPI:
+    """Builds a local stand-in of the jsonplaceholder /users and /todos API
+
+    Parameters
+    ----------
+    latency_ms : float
+
+        Delay added to every answer, in milliseconds
+
+    jitter_ms : float
+
+        Maximum random delay added on top of [latency_ms], in milliseconds
+
+    error_rate : float
+
+        Fraction of requests answered with a 500
+
+    seed : int
+
+        Seed of the random generator, for reproducible runs
+    """
+    stub = FastAPI()
+    generator = random.Random(seed)
+    users, todos = build_users(), build_todos()
+    stub.state.requests = 0
+
+    def answer(request: Request, data: list) -> Response:
+        body = json.dumps(data).encode("utf-8")
+        etag = '"' + hashlib.md5(body).hexdigest() + '"'
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers={"ETag": etag})
+        return Response(content=body, media_type="application/json", headers={"ETag": etag})
+
+    @stub.middleware("http")
+    async def inject(request: Request, call_next):
+        stub.state.requests += 1
+        delay = latency_ms + generator.uniform(0, jitter_ms)
+        if delay > 0:
+            await asyncio.sleep(delay / 1000)
+        if error_rate > 0 and generator.random() < error_rate:
+            return Response(status_code=500, content=b"Injected error")
+        return await call_next(request)
+
+    @stub.get("/users")
+    async def get_users(request: Request):
+        return answer(request, users)
+
+    @stub.get("/todos")
+    async def get_todos(request: Request, userId: int = None):
+        return answer(request, [todo for todo in todos if userId is None or todo["userId"] == userId])
+
+    return stub
+
+#endregion ---- APP -----------------------------------------------------------------------------------------
+
+#region ------- CLI -----------------------------------------------------------------------------------------
+
+def main(argv: list = None):
+    parser = argparse.ArgumentParser(description="Local stub of the jsonplaceholder API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency-ms", type=float, default=0, help="Delay added to every answer")
+    parser.add_argument("--jitter-ms", type=float, default=0, help="Maximum random delay added on top of the latency")
+    parser.add_argument("--error-rate", type=float, default=0, help="Fraction of requests answered with a 500")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    import uvicorn
+    stub = create_stub_app(args.latency_ms, args.jitter_ms, args.error_rate, args.seed)
+    uvicorn.run(stub, host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
+
+#endregion ---- CLI -----------------------------------------------------------------------------------------